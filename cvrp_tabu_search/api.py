@@ -0,0 +1,160 @@
+import os
+import math
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from cvrp_tabu_search.problem import Instance, Run, Parameters, StoppingCriteria
+from cvrp_tabu_search.tabu_search import run_tabu
+from cvrp_tabu_search.move_cache import MoveCache
+from cvrp_tabu_search.clarke_wright import clarke_wright
+from cvrp_tabu_search.multi_start import is_valid
+from cvrp_tabu_search.cache import get_neighbors, compact_weights
+from cvrp_tabu_search.distances import EuclideanDistances, get_lazy_neighbors
+
+# parâmetros (tenure, frequência, invalidez) usados quando a solução é válida e quando não é, os mesmos do bench
+DEFAULT_PARAMETERS = (3, 0.001, 0.1, 3, 0.001, 0.1)
+
+
+def make_instance(
+    coords: np.ndarray,
+    demands: np.ndarray,
+    capacity: int,
+    vehicles: int = None,
+    name: str = "instance",
+    float_costs: bool = False,
+    distances: str = "matrix",
+    distance_cache: int = 0,
+) -> Instance:
+    """Monta a instância a partir dos arrays, sem ler arquivos. O vértice 0 é o depósito.
+
+    Args:
+        coords (np.ndarray): coordenadas (n x 2) dos vértices
+        demands (np.ndarray): demanda de cada vértice (0 no depósito)
+        capacity (int): capacidade dos veículos
+        vehicles (int): número de rotas permitido; por padrão, o mínimo pela demanda total
+        name (str): nome da instância
+        float_costs (bool): se as distâncias não são arredondadas para inteiros
+        distances (str): "matrix" para a matriz de distâncias, ou "lazy" para calculá-las sob demanda
+        distance_cache (int): vizinhos com a distância guardada por vértice, com distances="lazy"
+    """
+    coords = np.asarray(coords, dtype=float)
+    # mesma fórmula das instâncias EUC_2D lidas do disco
+    w = EuclideanDistances(coords, float_costs)
+    if distances == "lazy":
+        neighbors = get_lazy_neighbors(w)
+        if distance_cache:
+            w.set_neighbor_cache(neighbors, distance_cache)
+    elif distances == "matrix":
+        w = w[np.arange(len(coords))]
+        w = np.ascontiguousarray(w) if float_costs else compact_weights(w)
+        neighbors = get_neighbors(w)
+    else:
+        raise ValueError(f"Unknown distances backend: {distances}")
+
+    p = Instance()
+    p.name = name
+    p.w = w
+    p.d = np.asarray(demands)
+    p.c = int(capacity)
+    p.depot_idx = np.array([0])
+    p.n = len(coords)
+    p.k = int(vehicles) if vehicles is not None else math.ceil(p.d.sum() / p.c)
+    p.coords = coords
+    # sem melhor solução conhecida
+    p.solution = {"routes": [], "cost": None}
+    p.neighbors = neighbors
+    return p
+
+
+def check_stopping(budget: float, max_iterations: int = None, max_no_improvement: int = None, target: float = None):
+    """Exige algum critério de parada; sem nenhum, a busca não terminaria."""
+    if budget is None and max_iterations is None and max_no_improvement is None and target is None:
+        raise ValueError("solve needs a stopping criterion: budget, max_iterations, max_no_improvement or target")
+
+
+def as_instance(instance) -> Instance:
+    """Aceita uma Instance ou um dict com as chaves coords, demands e capacity (e, opcionalmente, os demais argumentos
+    de make_instance)."""
+    if isinstance(instance, Instance):
+        return instance
+    return make_instance(**instance)
+
+
+def solve(
+    instance,
+    budget: float = 1.0,
+    params: tuple = DEFAULT_PARAMETERS,
+    seed=0,
+    max_iterations: int = None,
+    max_no_improvement: int = None,
+    target: float = None,
+    batch: bool = True,
+    cpu_time: bool = False,
+    move_cache: bool = False,
+    cw_top_k: int = None,
+) -> dict:
+    """Resolve a instância no próprio processo, sem barra de progresso e sem escrever arquivos.
+
+    Args:
+        instance: Instance ou dict aceito por as_instance
+        budget (float): tempo máximo da busca em segundos (None para parar só pelos outros critérios, e então ao menos
+            um deles precisa ser dado)
+        params (tuple): parâmetros (v_t, v_f, v_i, i_t, i_f, i_i), como nas combinações dos arquivos de configuração
+        seed: semente da execução
+        max_iterations (int): número máximo de iterações
+        max_no_improvement (int): iterações sem melhora da melhor solução até parar
+        target (float): custo que, se alcançado por uma solução válida, encerra a busca
+        batch (bool): se usa as vizinhanças vetorizadas
+        cpu_time (bool): se o orçamento é medido em tempo de CPU
+        move_cache (bool): se guarda os movimentos de cada par de rotas entre iterações
+        cw_top_k (int): vizinhos considerados nas economias da solução inicial
+
+    Returns:
+        dict: rotas (sem o depósito) e custo da melhor solução, se ela é válida, e o resumo da busca
+    """
+    check_stopping(budget, max_iterations, max_no_improvement, target)
+    p = as_instance(instance)
+    v_t, v_f, v_i, i_t, i_f, i_i = params
+
+    random.seed(seed)
+    s = clarke_wright(p, cw_top_k)
+
+    run = Run(s, p.n, Parameters(p.n, v_t, v_f, v_i), Parameters(p.n, i_t, i_f, i_i), seed)
+    stopping = StoppingCriteria(max_iterations, max_no_improvement, target)
+    cache = MoveCache() if move_cache else None
+    run_tabu(p, budget, run, s, batch=batch, cpu_time=cpu_time, progress=False, stopping=stopping, cache=cache)
+
+    best = run.best_solution
+    return {
+        "name": p.name,
+        "routes": [r for r in best.s if r],
+        "cost": best.f,
+        "valid": is_valid(p, best),
+        "initial": s.f,
+        **run.summary(),
+    }
+
+
+def _solve_job(args: tuple) -> dict:
+    instance, kwargs = args
+    return solve(instance, **kwargs)
+
+
+def solve_many(instances: list, workers: int = None, **kwargs) -> list[dict]:
+    """Resolve várias instâncias, cada uma em um processo do pool, com os mesmos argumentos de solve.
+
+    Instâncias dadas como dict são montadas nos processos. Com workers=1, resolve tudo no próprio processo.
+
+    Returns:
+        list[dict]: o resultado de solve de cada instância, na ordem dada
+    """
+    # confere antes de enviar as instâncias aos processos
+    check_stopping(kwargs.get("budget", 1.0), kwargs.get("max_iterations"), kwargs.get("max_no_improvement"), kwargs.get("target"))
+    jobs = [(instance, kwargs) for instance in instances]
+    if workers == 1:
+        return [_solve_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # poucas instâncias por envio, para dividir bem instâncias pequenas de tamanhos diferentes
+        chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+        return list(executor.map(_solve_job, jobs, chunksize=chunksize))
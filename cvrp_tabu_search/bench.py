@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import platform
+import tempfile
+import numpy as np
+from datetime import datetime
+from cvrp_tabu_search.problem import get_instance, set_granular, Instance, Run, Parameters, Solution, MoveBatch
+from cvrp_tabu_search.tabu_search import run_tabu
+from cvrp_tabu_search.clarke_wright import clarke_wright
+from cvrp_tabu_search.multi_start import is_valid
+from cvrp_tabu_search.neighborhoods import (
+    shift_neighborhood,
+    intraswap_neighborhood,
+    swap_neighborhood,
+    crossover_neighborhood,
+    shift_neighborhood_batch,
+    swap_neighborhood_batch,
+    shift_neighborhood_granular,
+    swap_neighborhood_granular,
+    crossover_neighborhood_granular,
+)
+
+BENCH_SETS = ["Vrp-Set-A/A", "Vrp-Set-B/B", "Vrp-Set-F/F"]
+
+NEIGHBORHOODS = [shift_neighborhood, intraswap_neighborhood, swap_neighborhood, crossover_neighborhood, shift_neighborhood_batch, swap_neighborhood_batch]
+GRANULAR_NEIGHBORHOODS = [shift_neighborhood_granular, swap_neighborhood_granular, crossover_neighborhood_granular]
+
+# parâmetros fixos da busca, para que os resultados sejam comparáveis entre versões
+BENCH_PARAMETERS = (3, 0.001, 0.1)
+
+
+def count_neighbors(f, s: Solution, p: Instance) -> int:
+    """Percorre toda a vizinhança e conta os movimentos avaliados. Os geradores escalares só produzem os movimentos que
+    respeitam a capacidade, então cada lote conta só as posições da sua máscara valid, que segue a mesma regra."""
+    total = 0
+    for mv in f(s, p):
+        total += int(np.count_nonzero(mv.valid)) if isinstance(mv, MoveBatch) else 1
+    return total
+
+
+def best_time(f, repeats: int) -> tuple[float, object]:
+    """Menor tempo entre as repetições, e o resultado da última."""
+    times = []
+    for _ in range(repeats):
+        t_s = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - t_s)
+    return min(times), result
+
+
+def bench_neighborhoods(p: Instance, s: Solution, repeats: int, granular_k: int) -> dict[str, float]:
+    """Vizinhos avaliados por segundo em cada vizinhança, a partir da solução s."""
+    results = {}
+    for f in NEIGHBORHOODS:
+        elapsed, count = best_time(lambda: count_neighbors(f, s, p), repeats)
+        results[f.__name__] = count / elapsed if elapsed > 0 else None
+
+    # as vizinhanças granulares só contam os movimentos que criam arestas candidatas
+    set_granular(p, granular_k)
+    for f in GRANULAR_NEIGHBORHOODS:
+        elapsed, count = best_time(lambda: count_neighbors(f, s, p), repeats)
+        results[f.__name__] = count / elapsed if elapsed > 0 else None
+    p.candidates = None
+    p.candidate_mask = None
+
+    return results
+
+
+def bench_search(p: Instance, search_time: float, batch: bool, seed: int) -> dict:
+    """Executa a busca tabu e mede iterações por segundo e a curva gap x tempo contra a melhor solução conhecida."""
+    random.seed(seed)
+    s = clarke_wright(p)
+    bks = p.solution["cost"]
+
+    run = Run(s, p.n, Parameters(p.n, *BENCH_PARAMETERS), Parameters(p.n, *BENCH_PARAMETERS), seed)
+    curve = [[0.0, (s.f - bks) / bks]] if is_valid(p, s) else []
+    t_s = time.perf_counter()
+
+    def record(run: Run, s: Solution) -> bool:
+        if run.last_improvement == run.iteration:
+            curve.append([time.perf_counter() - t_s, (run.best_solution.f - bks) / bks])
+        return False
+
+    with tempfile.TemporaryDirectory() as folder:
+        run.begin_savefile(folder, p.name, save_improvements=True)
+        run_tabu(p, search_time, run, s, batch=batch, progress=False, callback=record)
+
+    return {
+        "iterations": run.iteration,
+        "iterations_per_second": run.iteration / run.elapsed if run.elapsed > 0 else None,
+        "gap": curve[-1][1] if curve else None,
+        "curve": curve,
+    }
+
+
+def bench_instance(path: str, search_time: float, repeats: int, granular_k: int, batch: bool, seed: int) -> dict:
+    p = get_instance(path)
+    construction, s = best_time(lambda: clarke_wright(p), repeats)
+
+    return {
+        "n": p.n,
+        "construction": {"clarke_wright": construction},
+        "neighborhoods": bench_neighborhoods(p, s, repeats, granular_k),
+        "search": bench_search(p, search_time, batch, seed),
+    }
+
+
+def list_bench_instances(sets: list[str] = BENCH_SETS) -> list[str]:
+    paths = []
+    for folder in sets:
+        path = os.path.join(os.getcwd(), folder)
+        paths.extend(sorted([os.path.join(path, i.removesuffix(".vrp")) for i in os.listdir(path) if i.endswith(".vrp")]))
+    return paths
+
+
+def run_bench(paths: list[str], search_time: float = 2.0, repeats: int = 3, granular_k: int = 10, batch: bool = True, seed: int = 1, progress=print) -> dict:
+    """Executa o benchmark nas instâncias dadas e retorna o relatório."""
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "search_time": search_time,
+            "repeats": repeats,
+            "granular_k": granular_k,
+            "batch": batch,
+            "seed": seed,
+        },
+        "instances": {},
+    }
+
+    for path in paths:
+        name = os.path.basename(path)
+        report["instances"][name] = bench_instance(path, search_time, repeats, granular_k, batch, seed)
+        search = report["instances"][name]["search"]
+        progress(name, "iterations/s:", round(search["iterations_per_second"] or 0, 1), "gap:", search["gap"])
+
+    return report
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.1, gap_threshold: float = 0.01) -> list[str]:
+    """Compara o relatório com um relatório de referência.
+
+    Vazões (vizinhos e iterações por segundo) regridem se caem mais que threshold (relativo), tempos de construção se
+    sobem mais que threshold, e o gap final se sobe mais que gap_threshold (absoluto).
+
+    Returns:
+        list[str]: descrição das regressões encontradas
+    """
+    regressions = []
+
+    def check(name: str, metric: str, value: float, base: float, higher_is_better: bool, tolerance: float, relative: bool = True):
+        if value is None or base is None:
+            return
+        limit = (base * (1 - tolerance) if higher_is_better else base * (1 + tolerance)) if relative else base + tolerance
+        if (value < limit) if higher_is_better else (value > limit):
+            regressions.append(f"{name} {metric}: {value:.6g} (baseline {base:.6g})")
+
+    for name, current in report["instances"].items():
+        base = baseline["instances"].get(name)
+        if base is None:
+            continue
+
+        for f, value in current["neighborhoods"].items():
+            check(name, f, value, base["neighborhoods"].get(f), True, threshold)
+        for f, value in current["construction"].items():
+            check(name, f, value, base["construction"].get(f), False, threshold)
+        check(name, "iterations_per_second", current["search"]["iterations_per_second"], base["search"]["iterations_per_second"], True, threshold)
+        check(name, "gap", current["search"]["gap"], base["search"]["gap"], False, gap_threshold, relative=False)
+
+    return regressions
@@ -0,0 +1,121 @@
+import os
+import vrplib
+import numpy as np
+from functools import lru_cache
+
+# pasta, ao lado dos arquivos da instância, com a versão compilada
+CACHE_DIR = ".cache"
+
+
+def compiled_paths(path: str, float_costs: bool = False) -> tuple[str, str, str]:
+    folder, name = os.path.split(path)
+    cache = os.path.join(folder, CACHE_DIR)
+    # a ordem dos vizinhos também depende do arredondamento (empates), então cada modo tem os seus arquivos, inclusive o
+    # .npz com as datas de modificação, para que um modo nunca valide as matrizes desatualizadas do outro
+    suffix = "f" if float_costs else ""
+    return (
+        os.path.join(cache, f"{name}{'.f' if suffix else ''}.npz"),
+        os.path.join(cache, f"{name}.w{suffix}.npy"),
+        os.path.join(cache, f"{name}.neighbors{suffix}.npy"),
+    )
+
+
+def source_mtimes(path: str) -> tuple[float, float]:
+    return os.path.getmtime(f"{path}.vrp"), os.path.getmtime(f"{path}.sol")
+
+
+def get_neighbors(w: np.ndarray) -> np.ndarray:
+    """Vizinhos de cada vértice ordenados por distância, com o próprio vértice por último."""
+    w = w.astype(float)
+    np.fill_diagonal(w, np.inf)
+    return np.argsort(w, axis=1, kind="stable")[:, :-1]
+
+
+def compact_weights(w: np.ndarray) -> np.ndarray:
+    """Converte a matriz de distâncias arredondada para o menor tipo inteiro em que nenhuma soma da avaliação estoura:
+    uma solução tem no máximo 2n arestas, e um movimento soma ou remove no máximo mais 4."""
+    bound = (2 * len(w) + 4) * int(w.max())
+    for dtype in (np.int16, np.int32):
+        if bound <= np.iinfo(dtype).max:
+            return np.ascontiguousarray(w, dtype=dtype)
+    return np.ascontiguousarray(w, dtype=np.int64)
+
+
+def parse_instance(path: str, float_costs: bool = False) -> dict:
+    """Lê os arquivos .vrp e .sol e calcula a matriz de distâncias e a lista de vizinhos. As distâncias são arredondadas
+    para inteiros, a não ser que float_costs seja verdadeiro."""
+    instance = vrplib.read_instance(f"{path}.vrp")
+    solution = vrplib.read_solution(f"{path}.sol")
+
+    w = np.ascontiguousarray(instance["edge_weight"], dtype=float) if float_costs else compact_weights(np.round(instance["edge_weight"]))
+    routes = [np.array(r, dtype=np.int64) for r in solution["routes"]]
+
+    return {
+        "name": np.array(instance["name"]),
+        "coords": instance["node_coord"] if "node_coord" in instance else np.zeros((0, 2)),
+        "demand": instance["demand"],
+        "capacity": np.array(instance["capacity"]),
+        "depot": instance["depot"],
+        "dimension": np.array(instance["dimension"]),
+        "cost": np.array(solution["cost"]),
+        # rotas da melhor solução conhecida, concatenadas
+        "routes": np.concatenate(routes) if routes else np.zeros(0, dtype=np.int64),
+        "route_offsets": np.cumsum([0] + [len(r) for r in routes]),
+        "w": w,
+        "neighbors": get_neighbors(w),
+    }
+
+
+def save_atomic(save, path: str, *args, **kwargs):
+    # escreve em um arquivo temporário para que processos concorrentes nunca leiam um arquivo pela metade
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        save(f, *args, **kwargs)
+    os.replace(tmp, path)
+
+
+def compile_instance(path: str, mtimes: tuple[float, float], float_costs: bool = False) -> dict:
+    data = parse_instance(path, float_costs)
+    npz_path, w_path, neighbors_path = compiled_paths(path, float_costs)
+
+    try:
+        os.makedirs(os.path.dirname(npz_path), exist_ok=True)
+        save_atomic(np.save, w_path, data["w"])
+        save_atomic(np.save, neighbors_path, data["neighbors"])
+        # o .npz é o último a ser escrito, e só é considerado válido se as outras partes já existem
+        meta = {k: v for k, v in data.items() if k not in ("w", "neighbors")}
+        save_atomic(np.savez, npz_path, mtimes=np.array(mtimes), **meta)
+    except OSError:
+        # sem permissão de escrita: usa a versão em memória
+        pass
+
+    return data
+
+
+@lru_cache(maxsize=32)
+def load_compiled(path: str, mtimes: tuple[float, float], float_costs: bool = False) -> dict:
+    """Carrega a versão compilada da instância, compilando-a se não existir ou se os arquivos de origem mudaram.
+
+    As matrizes são mapeadas em memória, então processos que carregam a mesma instância compartilham as páginas.
+    """
+    npz_path, w_path, neighbors_path = compiled_paths(path, float_costs)
+
+    if not all([os.path.exists(i) for i in (npz_path, w_path, neighbors_path)]):
+        return compile_instance(path, mtimes, float_costs)
+
+    with np.load(npz_path) as f:
+        data = dict(f)
+    if tuple(data["mtimes"]) != mtimes:
+        return compile_instance(path, mtimes, float_costs)
+
+    # np.asarray evita o custo de indexação da subclasse np.memmap
+    data["w"] = np.asarray(np.load(w_path, mmap_mode="r"))
+    data["neighbors"] = np.asarray(np.load(neighbors_path, mmap_mode="r"))
+    return data
+
+
+def load_instance_data(path: str, cache: bool = True, float_costs: bool = False) -> dict:
+    if not cache:
+        return parse_instance(path, float_costs)
+    # as datas de modificação fazem parte da chave, invalidando também o cache em memória
+    return load_compiled(path, source_mtimes(path), float_costs)
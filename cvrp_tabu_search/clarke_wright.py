@@ -1,52 +1,97 @@
-from copy import deepcopy
-from cvrp_tabu_search.utils import get_route_demand
+import numpy as np
 from cvrp_tabu_search.problem import Solution, Instance
 
 
-def clarke_wright(p: Instance) -> Solution:
-    demand_points = [i for i in range(p.n) if i != p.depot_idx]
-    # inicia com cada cliente em uma rota
-    routes = [[i] for i in demand_points]
+def get_savings(p: Instance, customers: np.ndarray, top_k: int = None, lam: float = 1.0):
+    """Retorna os pares de clientes (i, j), i < j, ordenados de forma não crescente pela economia
+    w[0, i] + w[0, j] - lam * w[i, j]. Empates mantêm a ordem dos pares.
 
-    # faz todas as conexoes e ordena de forma não decrescente
-    savings = [(p.w[p.depot_idx, i] + p.w[p.depot_idx, j] - p.w[i, j], [i, j]) for i in demand_points for j in demand_points[i + 1 :]]
-    savings = sorted(savings, key=lambda x: x[0], reverse=True)
+    Com top_k, considera apenas os pares entre cada cliente e seus top_k vizinhos mais próximos, sem materializar todos
+    os O(n²) pares.
+    """
+    w0 = p.w[p.depot_idx].ravel()
+    # lam = 1 mantém as economias inteiras
+    shape = 1 if lam == 1 else lam
 
-    def fits(r1: list[int], r2: list[int]) -> bool:
-        return get_route_demand(r1, p.d) + get_route_demand(r2, p.d) <= p.c
+    if top_k is None:
+        a, b = np.triu_indices(len(customers), k=1)
+    else:
+        slot = np.full(p.n, -1)
+        slot[customers] = np.arange(len(customers))
+        # uma coluna a mais, porque o depósito pode estar entre os vizinhos
+        nearest = slot[p.neighbors[customers, : top_k + 1]]
+        a = np.repeat(np.arange(len(customers)), nearest.shape[1])
+        b = nearest.ravel()
+        a, b = a[b >= 0], b[b >= 0]
+        # np.unique ordena os pares, mantendo a mesma ordem do modo completo
+        a, b = np.unique(np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1), axis=0).T
 
-    def get_route(vertex: int) -> list[int]:
-        r = routes[vertex]
-        while isinstance(r, int):
-            r = routes[r]
-        return r
+    i, j = customers[a], customers[b]
+    savings = w0[i] + w0[j] - shape * p.w[i, j]
+    order = np.argsort(-savings, kind="stable")
+    return i[order].tolist(), j[order].tolist()
 
-    def merge_routes(r1: list, r2: list):
-        r1.extend(deepcopy(r2))
-        for l in r2:
-            routes[l - 1] = routes.index(r1)
 
-    # para cada aresta, veja se é conectável e junte as rotas
-    for k in savings:
-        i, j = k[1]
-        r1 = get_route(i - 1)
-        r2 = get_route(j - 1)
+def clarke_wright(p: Instance, top_k: int = None, lam: float = 1.0) -> Solution:
+    """Constrói a solução pelo algoritmo das economias. O parâmetro de forma lam pondera a distância entre os clientes
+    na economia; valores diferentes de 1 geram soluções iniciais diferentes.
+
+    Com as distâncias calculadas sob demanda, top_k nulo considera todos os vizinhos guardados de cada cliente, em vez de
+    todos os O(n²) pares, que voltariam a ocupar a memória que esse modo evita."""
+    if top_k is None and not isinstance(p.w, np.ndarray):
+        top_k = p.neighbors.shape[1]
+    customers = np.setdiff1d(np.arange(p.n), p.depot_idx)
+    slot = {v: k for k, v in enumerate(customers.tolist())}
+
+    # inicia com cada cliente em uma rota; cada rota é representada pelo seu índice no union-find
+    parent = list(range(len(customers)))
+    routes = [[v] for v in customers.tolist()]
+    demands = [p.d[v] for v in customers]
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def merge_routes(a: int, b: int):
+        # a rota b é adicionada ao final da rota a
+        routes[a].extend(routes[b])
+        demands[a] += demands[b]
+        routes[b] = None
+        parent[b] = a
+
+    def try_merge(i: int, j: int):
+        a = find(slot[i])
+        b = find(slot[j])
 
         # se já pertencerem a mesma rota
-        if r1 == r2:
-            continue
+        if a == b:
+            return
 
         # se ambos são pontos externos e a rota tem capacidade, conecte-os
-        if fits(r1, r2):
+        if demands[a] + demands[b] <= p.c:
+            r1, r2 = routes[a], routes[b]
             if i == r1[0] and j == r2[-1]:
-                merge_routes(r2, r1)
+                merge_routes(b, a)
             elif i == r1[-1] and j == r2[0]:
-                merge_routes(r1, r2)
+                merge_routes(a, b)
             elif i == r1[-1] and j == r2[-1]:
                 r2.reverse()
-                merge_routes(r1, r2)
+                merge_routes(a, b)
             elif i == r1[0] and j == r2[0]:
                 r1.reverse()
-                merge_routes(r1, r2)
-            
-    return Solution([i for i in routes if isinstance(i, list)], p.d, p.w)
+                merge_routes(a, b)
+
+    # para cada aresta, veja se é conectável e junte as rotas
+    for i, j in zip(*get_savings(p, customers, top_k, lam)):
+        try_merge(i, j)
+
+    if top_k is not None:
+        # os pares dos vizinhos próximos acabam antes de as pontas das rotas se encontrarem; termina com todos os pares
+        # entre as pontas restantes, que são poucas
+        endpoints = np.unique([v for r in routes if r is not None for v in (r[0], r[-1])])
+        for i, j in zip(*get_savings(p, endpoints, None, lam)):
+            try_merge(i, j)
+
+    return Solution([r for r in routes if r is not None], p.d, p.w)
@@ -0,0 +1,58 @@
+import random
+import numpy as np
+from cvrp_tabu_search.problem import Solution, Instance
+
+
+def sweep(p: Instance, rng: random.Random) -> Solution:
+    """Ordena os clientes pelo ângulo em relação ao depósito, a partir de um ângulo inicial aleatório, e preenche as
+    rotas nessa ordem até estourar a capacidade."""
+    customers = np.setdiff1d(np.arange(p.n), p.depot_idx)
+    depot = p.coords[p.depot_idx].reshape(2)
+    angles = np.arctan2(p.coords[customers, 1] - depot[1], p.coords[customers, 0] - depot[0])
+    angles = (angles - rng.uniform(-np.pi, np.pi)) % (2 * np.pi)
+
+    routes = [[]]
+    demand = 0
+    for v in customers[np.argsort(angles, kind="stable")].tolist():
+        if demand + p.d[v] > p.c and len(routes[-1]) > 0:
+            routes.append([])
+            demand = 0
+        routes[-1].append(v)
+        demand += p.d[v]
+
+    return Solution(routes, p.d, p.w)
+
+
+def nearest_neighbor(p: Instance, rng: random.Random, candidates: int = 3) -> Solution:
+    """Constrói as rotas indo sempre para um dos clientes mais próximos (sorteado entre os `candidates` mais próximos)
+    que ainda cabem na rota; quando nenhum cabe, volta ao depósito e começa uma nova rota."""
+    unvisited = set(np.setdiff1d(np.arange(p.n), p.depot_idx).tolist())
+    depot = int(np.ravel(p.depot_idx)[0])
+
+    routes = []
+    while unvisited:
+        route = []
+        demand = 0
+        v = depot
+        while True:
+            feasible = [u for u in p.neighbors[v].tolist() if u in unvisited and demand + p.d[u] <= p.c][:candidates]
+            if len(feasible) < candidates and unvisited and p.neighbors.shape[1] < p.n - 1:
+                # a lista de vizinhos pode ser truncada (distâncias sob demanda): procura entre todos os não visitados
+                rest = np.array(sorted(unvisited), dtype=np.int64)
+                rest = rest[np.argsort(p.w[v, rest], kind="stable")]
+                feasible = [u for u in rest.tolist() if demand + p.d[u] <= p.c][:candidates]
+            if not feasible:
+                break
+            v = rng.choice(feasible)
+            route.append(v)
+            demand += p.d[v]
+            unvisited.remove(v)
+
+        # cliente com demanda maior que a capacidade fica sozinho em uma rota
+        if not route:
+            v = min(unvisited)
+            route.append(v)
+            unvisited.remove(v)
+        routes.append(route)
+
+    return Solution(routes, p.d, p.w)
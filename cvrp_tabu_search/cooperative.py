@@ -0,0 +1,171 @@
+import os
+import json
+import math
+import time
+import random
+import numpy as np
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
+from cvrp_tabu_search.problem import get_stopping, load_run_instance, Instance, Options, Run, Parameters, Solution, CompactSolution
+from cvrp_tabu_search.tabu_search import run_tabu
+from cvrp_tabu_search.clarke_wright import clarke_wright
+from cvrp_tabu_search.multi_start import is_valid
+
+
+class ElitePool:
+    """Melhores soluções válidas encontradas pelos processos, guardadas em um processo gerenciador e acessadas por
+    proxies. Cada elemento é um par (custo, solução), com a solução sem rotas vazias em uma CompactSolution, ordenado
+    pelo custo."""
+
+    def __init__(self, manager, size: int):
+        self.size: int = size
+        self.entries = manager.list()
+        self.lock = manager.Lock()
+
+    def offer(self, s: Solution) -> bool:
+        """Tenta inserir a solução no pool. Retorna se ela foi inserida."""
+        compact = CompactSolution([r for r in s.s if len(r) > 0], s.f)
+        with self.lock:
+            entries = list(self.entries)
+            if any([e_f == s.f and e.same_routes(compact) for e_f, e in entries]):
+                return False
+            if len(entries) >= self.size and s.f >= entries[-1][0]:
+                return False
+
+            entries.append((s.f, compact))
+            entries.sort(key=lambda e: e[0])
+            self.entries[:] = entries[: self.size]
+        return True
+
+    def best(self) -> float:
+        entries = self.entries[:1]
+        return entries[0][0] if entries else float("inf")
+
+    def sample(self, rng: random.Random) -> tuple[float, CompactSolution]:
+        entries = list(self.entries)
+        return rng.choice(entries) if entries else None
+
+
+def cooperate(p: Instance, pool: ElitePool, rng: random.Random, exchange_every: int, stagnation: int, stats: dict):
+    """Cria o callback de um processo: a cada exchange_every iterações oferece a sua melhor solução ao pool e, se a
+    melhor solução não melhora há stagnation iterações, reinicia a busca a partir de uma solução do pool.
+
+    A busca para quando alguma solução do pool alcança a melhor solução conhecida.
+    """
+    target = p.solution["cost"]
+    offered = float("inf")
+    best_f = float("inf")
+    last_improvement = 0
+
+    def callback(run: Run, s: Solution) -> bool:
+        nonlocal offered, best_f, last_improvement
+        it = run.iteration
+
+        if run.best_solution.f < best_f:
+            best_f = run.best_solution.f
+            last_improvement = it
+
+        if it % exchange_every == 0:
+            # a melhor solução começa como a inicial, que pode ter rotas demais
+            if run.best_solution.f < offered and is_valid(p, run.best_solution):
+                offered = run.best_solution.f
+                stats["offers"] += pool.offer(run.best_solution)
+            if pool.best() <= target:
+                return True
+
+        if it - last_improvement >= stagnation:
+            elite = pool.sample(rng)
+            last_improvement = it
+            if elite is None:
+                return False
+
+            f, compact = elite
+            # mantém ao menos o mesmo número de rotas, com as rotas vazias ao final
+            s.restore(compact.to_solution(p.d, p.w, len(s.s)))
+            # a memória de curto prazo não vale para a nova solução; a de frequência é mantida
+            run.tabu_until = np.zeros((p.n, len(s.s)), dtype=np.int64)
+            # o critério max_no_improvement conta a partir do reinício
+            run.last_improvement = it
+            if f < run.best_solution.f:
+                run.best_solution = s.copy()
+                best_f = f
+            stats["restarts"] += 1
+
+        return False
+
+    return callback
+
+
+def run_worker(
+    instance_path: str, config: tuple, worker: int, results_folder: str, options: Options, deadline: float, pool: ElitePool, exchange_every: int, stagnation: int
+) -> dict:
+    """Executa a busca tabu de um processo cooperativo até o prazo comum.
+
+    Returns:
+        dict: resumo do processo
+    """
+    instance = load_run_instance(instance_path, options)
+    v_t, v_f, v_i, i_t, i_f, i_i, seed = config
+
+    worker_seed = f"{seed}-{worker}"
+    random.seed(worker_seed)
+    s = clarke_wright(instance, options.cw_top_k)
+
+    valid_params = Parameters(instance.n, v_t, v_f, v_i)
+    invalid_params = Parameters(instance.n, i_t, i_f, i_i)
+
+    run = Run(s, instance.n, valid_params, invalid_params, seed)
+    run.savefile_suffix = run.savefile_suffix.removesuffix(".csv") + f"_worker_{worker}.csv"
+    run.begin_savefile(results_folder, instance.name, options.save_every, options.save_improvements)
+
+    stats = {"offers": 0, "restarts": 0}
+    callback = cooperate(instance, pool, random.Random(worker_seed), exchange_every, stagnation, stats)
+    run_tabu(instance, max(0.0, deadline - time.time()), run, s, options.invalid, options.batch, progress=False, callback=callback, stopping=get_stopping(options, instance))
+
+    return {
+        "worker": worker,
+        "config": list(config),
+        "best": run.best_solution.f,
+        "valid": is_valid(instance, run.best_solution),
+        "iterations": run.iteration,
+        "stop_reason": run.stop_reason,
+        **stats,
+        "output": run.save_path,
+    }
+
+
+def run_cooperative(
+    instance_path: str, configs: list[tuple], results_folder: str, options: Options, workers: int, pool_size: int = 10, exchange_every: int = 100, stagnation: int = 1000
+) -> dict:
+    """Resolve uma instância com vários processos cooperativos, cada um com uma combinação de parâmetros (configs[k] para o
+    processo k, em ciclo), trocando soluções por um pool de elite. Todos param no mesmo prazo, options.run_time
+    segundos (tempo real) após o começo, ou sem prazo quando run_time é nulo (os demais critérios de parada valem para
+    cada processo).
+
+    As trajetórias de cada processo ficam em results_folder/cooperative, junto de um .json com o pool de elite final e
+    o resumo dos processos.
+
+    Returns:
+        dict: resumo da execução
+    """
+    folder = os.path.join(results_folder, "cooperative")
+    os.makedirs(folder, exist_ok=True)
+
+    deadline = time.time() + options.run_time if options.run_time is not None else math.inf
+
+    with Manager() as manager:
+        pool = ElitePool(manager, pool_size)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [
+                executor.submit(run_worker, instance_path, configs[k % len(configs)], k, folder, options, deadline, pool, exchange_every, stagnation)
+                for k in range(workers)
+            ]
+            results = [job.result() for job in jobs]
+        elite = list(pool.entries)
+
+    name = os.path.basename(instance_path)
+    summary = {"instance": name, "best": elite[0][0] if elite else None, "elite": [{"cost": f, "routes": c.s} for f, c in elite], "workers": results}
+    with open(os.path.join(folder, f"{name}__cooperative_s_{configs[0][-1]}.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
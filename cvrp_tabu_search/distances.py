@@ -0,0 +1,120 @@
+import math
+import vrplib
+import numpy as np
+
+# vizinhos guardados por vértice quando as distâncias são calculadas sob demanda (a lista completa seria O(n²))
+LAZY_NEIGHBORS = 100
+# linhas da matriz de distâncias calculadas de cada vez ao montar a lista de vizinhos
+NEIGHBORS_BLOCK = 256
+
+
+class EuclideanDistances:
+    """Distâncias EUC_2D calculadas a partir das coordenadas quando consultadas, no lugar da matriz n x n de p.w.
+
+    Aceita a mesma indexação usada com a matriz: w.item(i, j), w[i, j] com inteiros ou arrays (com broadcasting) e
+    w[i] para a linha de i. As distâncias são arredondadas para inteiros, como na matriz, a não ser que float_costs
+    seja verdadeiro. A memória é O(n).
+
+    Com set_neighbor_cache, item guarda as distâncias de cada vértice aos seus vizinhos mais próximos, que são as mais
+    consultadas pelas vizinhanças, e só calcula as demais.
+    """
+
+    def __init__(self, coords: np.ndarray, float_costs: bool = False):
+        self.coords: np.ndarray = np.ascontiguousarray(coords, dtype=float)
+        self.x: np.ndarray = self.coords[:, 0].copy()
+        self.y: np.ndarray = self.coords[:, 1].copy()
+        # quadrado da norma de cada ponto: as distâncias usam a mesma fórmula do vrplib, para que sejam iguais às da
+        # matriz (inclusive no arredondamento de distâncias x.5 com coordenadas fracionárias)
+        self.sq: np.ndarray = (self.coords**2).sum(axis=1)
+        # listas do Python são mais rápidas que arrays para consultas de um elemento
+        self.x_list: list[float] = self.x.tolist()
+        self.y_list: list[float] = self.y.tolist()
+        self.sq_list: list[float] = self.sq.tolist()
+        self.float_costs: bool = float_costs
+        self.dtype = np.dtype(float) if float_costs else np.dtype(np.int64)
+        self.shape: tuple[int, int] = (len(coords), len(coords))
+        self.ndim: int = 2
+        # distâncias guardadas de cada vértice aos seus vizinhos mais próximos (None quando desativado)
+        self.cache: list[dict[int, float]] = None
+
+    def set_neighbor_cache(self, neighbors: np.ndarray, size: int):
+        """Guarda as distâncias de cada vértice aos seus size primeiros vizinhos."""
+        nearest = neighbors[:, :size]
+        distances = self[np.arange(len(nearest))[:, None], nearest].tolist()
+        self.cache = [dict(zip(r, d)) for r, d in zip(nearest.tolist(), distances)]
+
+    def item(self, i: int, j: int):
+        if self.cache is not None:
+            d = self.cache[i].get(j)
+            if d is not None:
+                return d
+        if i == j:
+            return 0.0 if self.float_costs else 0
+        sq = self.sq_list[i] + self.sq_list[j] - 2 * (self.x_list[i] * self.x_list[j] + self.y_list[i] * self.y_list[j])
+        d = math.sqrt(max(0.0, sq))
+        return d if self.float_costs else round(d)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            # linha(s) da matriz
+            rows = np.asarray(key)
+            key = (rows[..., None] if rows.ndim > 0 else rows, np.arange(self.shape[1]))
+        i, j = [np.arange(n)[k] if isinstance(k, slice) else np.asarray(k) for k, n in zip(key, self.shape)]
+
+        sq = self.sq[i] + self.sq[j] - 2 * (self.x[i] * self.x[j] + self.y[i] * self.y[j])
+        d = np.sqrt(np.maximum(0.0, np.where(i == j, 0.0, sq)))
+        if not self.float_costs:
+            d = np.round(d).astype(self.dtype)
+        return d[()] if d.ndim == 0 else d
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def get_lazy_neighbors(w: EuclideanDistances, count: int = LAZY_NEIGHBORS) -> np.ndarray:
+    """Os count vizinhos mais próximos de cada vértice, na mesma ordem de get_neighbors (empates pelo índice), calculados
+    em blocos de linhas para não materializar a matriz."""
+    n = len(w)
+    count = min(count, n - 1)
+    neighbors = np.empty((n, count), dtype=np.int64)
+    for start in range(0, n, NEIGHBORS_BLOCK):
+        rows = np.arange(start, min(n, start + NEIGHBORS_BLOCK))
+        block = w[rows[:, None], np.arange(n)[None, :]].astype(float)
+        block[np.arange(len(rows)), rows] = np.inf
+
+        # a partição encontra a distância do count-ésimo vizinho; só os vértices até essa distância são ordenados
+        kth = np.take_along_axis(block, np.argpartition(block, count - 1, axis=1)[:, count - 1 : count], axis=1)
+        for r, (row, limit) in enumerate(zip(block, kth)):
+            closest = np.flatnonzero(row <= limit)
+            neighbors[rows[r]] = closest[np.argsort(row[closest], kind="stable")][:count]
+    return neighbors
+
+
+def parse_lazy_instance(path: str, float_costs: bool = False, neighbor_cache: int = 0) -> dict:
+    """Mesmo que parse_instance, mas sem a matriz de distâncias: w calcula as distâncias a partir das coordenadas e
+    neighbors só tem os LAZY_NEIGHBORS vizinhos mais próximos de cada vértice. Só vale para instâncias EUC_2D."""
+    instance = vrplib.read_instance(f"{path}.vrp", compute_edge_weights=False)
+    solution = vrplib.read_solution(f"{path}.sol")
+
+    if instance.get("edge_weight_type") != "EUC_2D":
+        raise ValueError(f"Lazy distances need an EUC_2D instance, {path} is {instance.get('edge_weight_type')}")
+
+    w = EuclideanDistances(instance["node_coord"], float_costs)
+    neighbors = get_lazy_neighbors(w)
+    if neighbor_cache:
+        w.set_neighbor_cache(neighbors, neighbor_cache)
+
+    routes = [np.array(r, dtype=np.int64) for r in solution["routes"]]
+    return {
+        "name": np.array(instance["name"]),
+        "coords": instance["node_coord"],
+        "demand": instance["demand"],
+        "capacity": np.array(instance["capacity"]),
+        "depot": instance["depot"],
+        "dimension": np.array(instance["dimension"]),
+        "cost": np.array(solution["cost"]),
+        "routes": np.concatenate(routes) if routes else np.zeros(0, dtype=np.int64),
+        "route_offsets": np.cumsum([0] + [len(r) for r in routes]),
+        "w": w,
+        "neighbors": neighbors,
+    }
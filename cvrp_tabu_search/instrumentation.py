@@ -0,0 +1,130 @@
+import time
+import numpy as np
+import pandas as pd
+from cvrp_tabu_search.problem import Instance, Solution, Run, Move, MoveBatch
+from cvrp_tabu_search.neighborhoods import respects_capacity
+
+# sufixo do arquivo com os tempos de cada iteração, salvo ao lado do .csv da execução
+PHASES_SUFFIX = ".phases.csv"
+
+# fases de uma iteração do run_tabu; a enumeração é o tempo gasto dentro dos geradores das vizinhanças e a avaliação é
+# o restante da busca pelo melhor vizinho (bias, tabu e critério de aspiração)
+PHASES = ["enumeration", "scoring", "apply", "memory", "savefile", "control", "overhead"]
+
+
+class Instrumentation:
+    """Tempos por fase de cada iteração e contadores por vizinhança. Só é usada quando passada ao run_tabu, então não
+    custa nada quando desativada."""
+
+    def __init__(self):
+        self.clock = time.perf_counter
+        # uma linha por iteração: iteração, vizinhança do movimento aceito e tempo de cada fase
+        self.rows: list[list] = []
+        # contadores de cada vizinhança: varreduras, movimentos gerados (antes do filtro de capacidade, os mesmos nas
+        # versões escalar e em lote), que respeitam a capacidade, rejeitados por serem tabu, tabu aceitáveis pelo critério
+        # de aspiração e aceitos; os três últimos só contam os movimentos que passam pelo filtro
+        self.counters: dict[str, dict[str, int]] = {}
+
+        self.current: dict[str, float] = None
+        self.last: float = None
+
+    def begin(self):
+        self.current = {k: 0.0 for k in PHASES}
+        self.last = self.clock()
+
+    def lap(self, phase: str):
+        """Atribui à fase o tempo desde a última marcação."""
+        now = self.clock()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, iteration: int, neighborhood: str):
+        # o tempo dentro dos geradores e da contagem foi marcado junto com o da avaliação
+        self.current["scoring"] -= self.current["enumeration"] + self.current["overhead"]
+        self.rows.append([iteration, neighborhood] + [self.current[k] for k in PHASES])
+        self.get_counters(neighborhood)["accepted"] += 1
+
+    def get_counters(self, name: str) -> dict[str, int]:
+        if name not in self.counters:
+            self.counters[name] = {"scans": 0, "generated": 0, "feasible": 0, "tabu_rejected": 0, "aspirated": 0, "accepted": 0}
+        return self.counters[name]
+
+    def wrap(self, f, run: Run):
+        """Retorna a vizinhança f medindo o tempo dos seus geradores e contando os movimentos gerados.
+
+        Os geradores são chamados aceitando todos os movimentos, para que os que estouram a capacidade também sejam
+        contados, e o filtro de capacidade é aplicado aqui, com a mesma regra; o tempo de gerar os movimentos descartados
+        conta como custo da instrumentação, e não da enumeração."""
+        counters = self.get_counters(f.__name__)
+
+        def wrapped(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+            counters["scans"] += 1
+            gen = f(s, p, True, routes)
+            while True:
+                t_s = self.clock()
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    self.current["enumeration"] += self.clock() - t_s
+                    return
+                t_m = self.clock()
+                keep = self.count(counters, item, p, run, accept_all)
+                self.current["enumeration" if keep else "overhead"] += t_m - t_s
+                self.current["overhead"] += self.clock() - t_m
+                if keep:
+                    yield item
+
+        wrapped.__name__ = f.__name__
+        return wrapped
+
+    def count(self, counters: dict[str, int], item, p: Instance, run: Run, accept_all: bool) -> bool:
+        """Conta o movimento ou lote, gerado sem o filtro de capacidade, e aplica o filtro.
+
+        Returns:
+            bool: se o item segue para a busca; o lote sempre segue, com a máscara valid já filtrada
+        """
+        if isinstance(item, MoveBatch):
+            # sem o filtro de capacidade, a máscara valid só tem os candidatos das vizinhanças granulares
+            feasible = item.valid & respects_capacity(item.kind, item.d_i, item.d_j, p.c)
+            counters["generated"] += int(np.count_nonzero(item.valid))
+            counters["feasible"] += int(np.count_nonzero(feasible))
+            if not accept_all:
+                item.valid = feasible
+
+            tabu = (run.tabu_until[item.rows, item.j] > run.iteration)[:, None]
+            if item.cols is not None:
+                tabu = tabu | (run.tabu_until[item.cols, item.i] > run.iteration)[None, :]
+            tabu = item.valid & tabu
+            aspirated = tabu & (item.f < run.best_solution.f)
+
+            counters["aspirated"] += int(np.count_nonzero(aspirated))
+            counters["tabu_rejected"] += int(np.count_nonzero(tabu)) - int(np.count_nonzero(aspirated))
+            return True
+
+        mv: Move = item
+        feasible = bool(respects_capacity(mv.kind, mv.d_i, mv.d_j, p.c))
+        counters["generated"] += 1
+        counters["feasible"] += int(feasible)
+        if not (feasible or accept_all):
+            return False
+
+        if any([run.is_tabu(v, r) for v, r in mv.movement]):
+            if mv.f < run.best_solution.f:
+                counters["aspirated"] += 1
+            else:
+                counters["tabu_rejected"] += 1
+        return True
+
+    def save(self, path: str):
+        pd.DataFrame(self.rows, columns=["iteration", "neighborhood"] + PHASES).set_index("iteration").to_csv(path)
+
+    def summary(self) -> dict:
+        """Tempo total e médio por iteração de cada fase, e os contadores de cada vizinhança."""
+        times = np.array([r[2:] for r in self.rows]).reshape(-1, len(PHASES))
+        total = times.sum(axis=0)
+        return {
+            "iterations": len(self.rows),
+            "total": dict(zip(PHASES, total.tolist())),
+            "mean": dict(zip(PHASES, (total / max(1, len(self.rows))).tolist())),
+            "neighborhoods": self.counters,
+        }
@@ -4,11 +4,22 @@ import typer
 import traceback
 import random
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing_extensions import Annotated
-from cvrp_tabu_search.problem import get_instance, Run, Parameters
-from cvrp_tabu_search.tabu_search import run_tabu
+from cvrp_tabu_search.problem import get_instance, get_options, get_stopping, load_run_instance, Instance, Options, Run, Parameters
+from cvrp_tabu_search.tabu_search import run_tabu, STRUCTURES
+from cvrp_tabu_search.scheduler import OperatorScheduler
+from cvrp_tabu_search.move_cache import MoveCache
+from cvrp_tabu_search.parallel import NeighborhoodPool
+from cvrp_tabu_search.instrumentation import Instrumentation, PHASES_SUFFIX
+from cvrp_tabu_search.profiling import profile_call, summarize_profiles, PROFILE_SUFFIX
+from cvrp_tabu_search.results import save_records, run_record, csv_record, read_results, COLUMNS
 from cvrp_tabu_search.clarke_wright import clarke_wright
 from cvrp_tabu_search.utils import objective_function
+from cvrp_tabu_search.manifest import Manifest, job_key
+from cvrp_tabu_search.multi_start import run_portfolio
+from cvrp_tabu_search.cooperative import run_cooperative
+from cvrp_tabu_search.bench import run_bench, compare, list_bench_instances, BENCH_SETS
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -67,70 +78,303 @@ def check_instance_path(instance_path: str):
     return path
 
 
-def run(instance_path: str, run_time: int, all_configs: list, results_folder: str, invalid: bool = False):
+def list_instances(instance_paths: list[str]) -> list[str]:
+    """Retorna os caminhos de todas as instâncias da configuração, expandindo os diretórios."""
+    instances = []
+    for instance_path in instance_paths:
+        path = check_instance_path(instance_path)
+        if path is None:
+            continue
+
+        # se for diretório, executa todos os itens do diretório
+        if os.path.isdir(path):
+            paths = set([check_instance_path(os.path.join(path, i.removesuffix(".vrp"))) for i in os.listdir(path) if i.endswith(".vrp")])
+            instances.extend([os.path.join(os.getcwd(), i) for i in sorted(paths) if i is not None])
+
+        # se for um arquivo, executa a instância
+        else:
+            instances.append(path)
+
+    return instances
+
+
+def run_config(instance: Instance, config: tuple, results_folder: str, options: Options, progress: bool = True, profile: bool = False) -> Run:
+    """Executa o algoritmo para a instância dada com uma combinação de parâmetros.
+
+    Args:
+        instance (Instance): instância
+        config (tuple): combinação de parâmetros (v_t, v_f, v_i, i_t, i_f, i_i, seed)
+        results_folder (str): diretório de destino dos resultados
+        options (Options): opções de execução
+        progress (bool): se mostra a barra de progresso
+        profile (bool): se executa sob o cProfile, salvando o perfil ao lado do .csv
+    """
+    if profile:
+        run, profiler = profile_call(run_config, instance, config, results_folder, options, progress)
+        profiler.dump_stats(run.save_path.removesuffix(".csv") + PROFILE_SUFFIX)
+        return run
+
+    v_t, v_f, v_i, i_t, i_f, i_i, seed = config
+    print(instance.name, f" v_t={v_t}; ", f" v_f={v_f}; ", f" v_i={v_i}; ", f" i_t={i_t}; ", f" i_f={i_f}; ", f" i_i={i_i}; ", f" s={seed}; ")
+
+    random.seed(seed)
+
+    # solução inicial
+    s = clarke_wright(instance, options.cw_top_k)
+
+    valid_params = Parameters(instance.n, v_t, v_f, v_i)
+    invalid_params = Parameters(instance.n, i_t, i_f, i_i)
+
+    run = Run(s, instance.n, valid_params, invalid_params, seed)
+    run.begin_savefile(results_folder, instance.name, options.save_every, options.save_improvements)
+
+    stopping = get_stopping(options, instance)
+    instrument = Instrumentation() if options.instrument else None
+    scheduler = OperatorScheduler(STRUCTURES) if options.adaptive_operators else None
+    if options.neighborhood_workers > 1:
+        with NeighborhoodPool(instance, options.neighborhood_workers) as pool:
+            run = run_tabu(
+                instance, options.run_time, run, s, options.invalid, options.batch, options.cpu_time, progress, pool=pool, stopping=stopping, instrument=instrument, scheduler=scheduler
+            )
+    else:
+        cache = MoveCache() if options.move_cache else None
+        run = run_tabu(
+            instance, options.run_time, run, s, options.invalid, options.batch, options.cpu_time, progress, stopping=stopping, instrument=instrument, scheduler=scheduler, cache=cache
+        )
+
+    if progress and instrument is not None:
+        print_instrumentation(run.instrumentation)
+
+    save_records(results_folder, [run_record(instance, run)])
+
+    return run
+
+
+def print_instrumentation(summary: dict):
+    """Mostra o tempo por fase e os contadores de cada vizinhança de uma execução instrumentada."""
+    total = sum(summary["total"].values())
+    print(pd.DataFrame({"total (s)": summary["total"], "share": {k: v / total if total > 0 else 0 for k, v in summary["total"].items()}}).to_string())
+    print(pd.DataFrame(summary["neighborhoods"]).T.to_string())
+
+
+def run(instance_path: str, all_configs: list, results_folder: str, options: Options, manifest: Manifest = None, profile: bool = False):
     """Executa o algoritmo para a instância dada.
 
     Args:
         instance_path (str): caminho para a instância
-        run_time (int): tempo de execução
         all_configs (list): todas as combinações de parâmetros para testar
         results_folder (str): diretório de destino dos resultados
+        options (Options): opções de execução
+        manifest (Manifest): registro das execuções, usado para pular as que já foram concluídas
+        profile (bool): se executa cada combinação sob o cProfile
     """
-    instance = get_instance(instance_path)
-    for v_t, v_f, v_i, i_t, i_f, i_i, seed in all_configs:
-        print(instance_path, f" v_t={v_t}; ", f" v_f={v_f}; ", f" v_i={v_i}; ", f" i_t={i_t}; ", f" i_f={i_f}; ", f" i_i={i_i}; ", f" s={seed}; ")
+    keys = [job_key(instance_path, config, vars(options)) for config in all_configs]
+    if manifest is not None and all([manifest.is_done(key) for key in keys]):
+        print(instance_path, "already done, skipping")
+        return
+
+    instance = load_run_instance(instance_path, options)
+    for config, key in zip(all_configs, keys):
+        if manifest is None:
+            run_config(instance, config, results_folder, options, profile=profile)
+            continue
 
-        random.seed(seed)
+        if manifest.is_done(key):
+            continue
 
-        # solução inicial
-        s = clarke_wright(instance)
+        manifest.mark(key, "started", instance_path, config)
+        try:
+            run = run_config(instance, config, results_folder, options, profile=profile)
+        except Exception:
+            manifest.mark(key, "failed", instance_path, config)
+            raise
+        manifest.mark(key, "done", instance_path, config, run.save_path)
 
-        valid_params = Parameters(instance.n, v_t, v_f, v_i)
-        invalid_params = Parameters(instance.n, i_t, i_f, i_i)
 
-        run = Run(s, instance.n, valid_params, invalid_params, seed)
-        run.begin_savefile(results_folder, instance.name)
+def run_job(instance_path: str, config: tuple, results_folder: str, options: Options, profile: bool = False) -> str:
+    """Executa uma combinação (instância, parâmetros, semente) em um processo do pool.
 
-        run_tabu(instance, run_time, run, s, invalid)
+    Returns:
+        str: caminho do .csv com os resultados
+    """
+    instance = load_run_instance(instance_path, options)
+    run = run_config(instance, config, results_folder, options, progress=False, profile=profile)
+    return run.save_path
 
 
 @app_experiment.command(help="Executes the experiments")
 def exec(
     config_file: Annotated[str, typer.Option(help="Configuration file for the run")],
     results_folder: Annotated[str, typer.Option(help="Directory in which to save the run's .csv")],
+    workers: Annotated[int, typer.Option(help="Number of worker processes running (instance, parameters, seed) jobs in parallel")] = 1,
+    cpu_time: Annotated[bool, typer.Option(help="Measure the run time budget in CPU time (always on when workers > 1)")] = False,
+    resume: Annotated[bool, typer.Option(help="Skip the jobs already completed according to the results folder's manifest")] = True,
+    profile: Annotated[bool, typer.Option(help="Profile each job with cProfile, saving a .prof next to its .csv and a summary of the top functions")] = False,
 ):
     """Executa os experimentos descritos no arquivo de configuração e manda os resultados para a pasta dada.
 
     Args:
         config_file (Annotated[str, typer.Option, optional): arquivo de configuração. Defaults to "Configuration file for the run")].
         results_folder (Annotated[str, typer.Option, optional): pasta destino para os resultados. Defaults to "Directory in which to save the run's .csv")].
+        workers (Annotated[int, typer.Option, optional): número de processos executando em paralelo. Defaults to 1.
+        cpu_time (Annotated[bool, typer.Option, optional): mede o tempo de execução em tempo de CPU. Defaults to False.
+        resume (Annotated[bool, typer.Option, optional): pula as execuções já concluídas. Defaults to True.
+        profile (Annotated[bool, typer.Option, optional): executa cada combinação sob o cProfile. Defaults to False.
     """
     # carrega as configurações, cria as pastas
-    c, all_configs, invalid = init(config_file, results_folder)
-
-    for instance_path in c["instances"]:
-        path = check_instance_path(instance_path)
-        if path is None:
-            continue
-
-        # se for diretório, executa todos os itens do diretório
-        if os.path.isdir(path):
-            instances = set([check_instance_path(os.path.join(path, i.removesuffix(".vrp"))) for i in os.listdir(path) if i.endswith(".vrp")])
-            for i in sorted(instances):
-                path_ = os.path.join(os.getcwd(), i)
+    c, all_configs, _ = init(config_file, results_folder)
+    # com vários processos, o orçamento é medido em tempo de CPU para que a concorrência não reduza o tempo de cada execução
+    options = get_options(c, cpu_time or workers > 1)
+    instances = list_instances(c["instances"])
+
+    # registro das execuções na pasta de resultados; execuções interrompidas ou que falharam são refeitas
+    manifest = Manifest(results_folder)
+    if not resume:
+        manifest.jobs = {}
+
+    if workers > 1:
+        # cada execução vira um job independente, com sua própria semente e arquivo de resultados
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = {}
+            for path in instances:
+                for config in all_configs:
+                    key = job_key(path, config, vars(options))
+                    if manifest.is_done(key):
+                        continue
+                    manifest.mark(key, "started", path, config)
+                    jobs[pool.submit(run_job, path, config, results_folder, options, profile)] = (key, path, config)
+
+            print(f"{len(jobs)} jobs to run")
+            for job in as_completed(jobs):
+                key, path, config = jobs[job]
                 try:
-                    run(path_, c["run_time"], all_configs, results_folder, invalid)
+                    manifest.mark(key, "done", path, config, job.result())
+                    print("Finished:", job.result())
                 except Exception as e:
-                    print(e)
-                    print(traceback.format_exc(e))
-
-        # se for um arquivo, executa a instância
-        else:
+                    manifest.mark(key, "failed", path, config)
+                    print(path, config, e)
+                    print(traceback.format_exc())
+    else:
+        for path in instances:
             try:
-                run(path, c["run_time"], all_configs, results_folder, invalid)
+                run(path, all_configs, results_folder, options, manifest, profile)
             except Exception as e:
                 print(e)
-                print(traceback.format_exc(e))
+                print(traceback.format_exc())
+
+    if profile:
+        # resumo de todos os perfis da pasta, inclusive de execuções anteriores
+        summary = summarize_profiles(results_folder)
+        summary.to_csv(os.path.join(results_folder, "profile_summary.csv"))
+        print(summary.to_string())
+
+
+@app_experiment.command(help="Executes the experiments as parallel multi-start portfolios")
+def multistart(
+    config_file: Annotated[str, typer.Option(help="Configuration file for the run")],
+    results_folder: Annotated[str, typer.Option(help="Directory in which to save the run's .csv")],
+    starts: Annotated[int, typer.Option(help="Number of initial solutions (savings, randomized savings, sweep, nearest neighbor) per run")] = 4,
+    workers: Annotated[int, typer.Option(help="Number of worker processes running the starts in parallel")] = 4,
+):
+    """Executa cada combinação (instância, parâmetros, semente) como um portfólio de buscas tabu partindo de soluções
+    iniciais diferentes, em paralelo e com o mesmo prazo (run_time da configuração, em tempo real).
+
+    Args:
+        config_file (Annotated[str, typer.Option, optional): arquivo de configuração. Defaults to "Configuration file for the run")].
+        results_folder (Annotated[str, typer.Option, optional): pasta destino para os resultados. Defaults to "Directory in which to save the run's .csv")].
+        starts (Annotated[int, typer.Option, optional): número de soluções iniciais. Defaults to 4.
+        workers (Annotated[int, typer.Option, optional): número de processos executando em paralelo. Defaults to 4.
+    """
+    c, all_configs, _ = init(config_file, results_folder)
+    options = get_options(c)
+
+    for path in list_instances(c["instances"]):
+        for config in all_configs:
+            try:
+                summary = run_portfolio(path, config, results_folder, options, starts, workers)
+                print(os.path.basename(path), config, "best:", summary["best"], "start:", summary["winner"])
+            except Exception as e:
+                print(path, config, e)
+                print(traceback.format_exc())
+
+
+@app_experiment.command(help="Solves each instance with cooperating worker processes sharing an elite pool")
+def cooperative(
+    config_file: Annotated[str, typer.Option(help="Configuration file for the run")],
+    results_folder: Annotated[str, typer.Option(help="Directory in which to save the run's .csv")],
+    workers: Annotated[int, typer.Option(help="Number of cooperating worker processes; worker k uses the k-th parameter combination of the configuration")] = 4,
+    pool_size: Annotated[int, typer.Option(help="Number of elite solutions kept in the shared pool")] = 10,
+    exchange_every: Annotated[int, typer.Option(help="Iterations between offers of each worker's best solution to the pool")] = 100,
+    stagnation: Annotated[int, typer.Option(help="Iterations without improvement after which a worker restarts from an elite solution")] = 1000,
+):
+    """Resolve cada instância com vários processos executando a busca tabu com parâmetros diferentes, que trocam soluções
+    por um pool de elite e reiniciam a partir dele quando estagnam.
+
+    Args:
+        config_file (Annotated[str, typer.Option, optional): arquivo de configuração. Defaults to "Configuration file for the run")].
+        results_folder (Annotated[str, typer.Option, optional): pasta destino para os resultados. Defaults to "Directory in which to save the run's .csv")].
+        workers (Annotated[int, typer.Option, optional): número de processos. Defaults to 4.
+        pool_size (Annotated[int, typer.Option, optional): tamanho do pool de elite. Defaults to 10.
+        exchange_every (Annotated[int, typer.Option, optional): iterações entre as trocas com o pool. Defaults to 100.
+        stagnation (Annotated[int, typer.Option, optional): iterações sem melhora até reiniciar a partir do pool. Defaults to 1000.
+    """
+    c, all_configs, _ = init(config_file, results_folder)
+    options = get_options(c)
+
+    for path in list_instances(c["instances"]):
+        try:
+            summary = run_cooperative(path, all_configs, results_folder, options, workers, pool_size, exchange_every, stagnation)
+            print(os.path.basename(path), "best:", summary["best"], "restarts:", [w["restarts"] for w in summary["workers"]])
+        except Exception as e:
+            print(path, e)
+            print(traceback.format_exc())
+
+
+@app_experiment.command(help="Benchmarks neighborhood throughput, construction time and search quality")
+def bench(
+    output: Annotated[str, typer.Option(help="Path of the JSON report")] = "bench.json",
+    baseline: Annotated[str, typer.Option(help="JSON report of a previous benchmark to compare against")] = None,
+    instances: Annotated[list[str], typer.Option(help="Instances to benchmark (defaults to every instance of the bundled sets)")] = None,
+    search_time: Annotated[float, typer.Option(help="Seconds of tabu search per instance")] = 2.0,
+    repeats: Annotated[int, typer.Option(help="Repetitions of each timing; the fastest is kept")] = 3,
+    granular_k: Annotated[int, typer.Option(help="Neighbors per vertex for the granular neighborhoods")] = 10,
+    batch: Annotated[bool, typer.Option(help="Use the batched neighborhoods in the search")] = True,
+    threshold: Annotated[float, typer.Option(help="Relative drop in throughput (or rise in construction time) counted as a regression")] = 0.1,
+    gap_threshold: Annotated[float, typer.Option(help="Absolute rise in final gap counted as a regression")] = 0.01,
+):
+    """Mede vizinhos avaliados por segundo em cada vizinhança, tempo do Clarke-Wright, iterações por segundo da busca tabu
+    e a curva gap x tempo contra a melhor solução conhecida, salvando um relatório .json. Com baseline, compara com um
+    relatório anterior e termina com erro se houver regressões.
+
+    Args:
+        output (Annotated[str, typer.Option, optional): caminho do relatório. Defaults to "bench.json".
+        baseline (Annotated[str, typer.Option, optional): relatório de referência. Defaults to None.
+        instances (Annotated[list[str], typer.Option, optional): instâncias. Defaults to todas as dos conjuntos A, B e F.
+        search_time (Annotated[float, typer.Option, optional): segundos de busca por instância. Defaults to 2.0.
+        repeats (Annotated[int, typer.Option, optional): repetições de cada medida. Defaults to 3.
+        granular_k (Annotated[int, typer.Option, optional): vizinhos por vértice nas vizinhanças granulares. Defaults to 10.
+        batch (Annotated[bool, typer.Option, optional): usa as vizinhanças em lote na busca. Defaults to True.
+        threshold (Annotated[float, typer.Option, optional): queda relativa de vazão considerada regressão. Defaults to 0.1.
+        gap_threshold (Annotated[float, typer.Option, optional): aumento absoluto do gap considerado regressão. Defaults to 0.01.
+    """
+    paths = list_instances(instances) if instances else list_bench_instances(BENCH_SETS)
+    report = run_bench(paths, search_time, repeats, granular_k, batch)
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Report saved to", output)
+
+    if baseline is None:
+        return
+
+    with open(baseline) as f:
+        regressions = compare(report, json.load(f), threshold, gap_threshold)
+
+    for r in regressions:
+        print("Regression:", r)
+    if regressions:
+        raise typer.Exit(code=1)
+    print("No regressions against", baseline)
 
 
 def load_instance(instance_name: str):
@@ -155,7 +399,8 @@ def plot(result_file: Annotated[str, typer.Option(help="The target run's .csv")]
     instance_name, _ = result_file.split("/")[-1].split("__")
     instance = load_instance(instance_name)
 
-    df = pd.read_csv(result_file)
+    # o índice do .csv é a iteração
+    df = pd.read_csv(result_file, index_col=0)
 
     fig, ax = plt.subplots(tight_layout=True)
     ax.scatter(df.index, df["local"], c="b", s=1, lw=1)
@@ -165,9 +410,9 @@ def plot(result_file: Annotated[str, typer.Option(help="The target run's .csv")]
     ax.axhline(sol_cost, c="r", lw=1)
 
     min_idx = df["global"].idxmin()
-    ax.scatter([min_idx], [df.iloc[min_idx]["global"]], c="k", s=10, lw=1)
+    ax.scatter([min_idx], [df.loc[min_idx]["global"]], c="k", s=10, lw=1)
 
-    ax.set_title(f"Instance: {instance_name} | Solution: {sol_cost} | Best: {df.iloc[min_idx]['global']} | Iteration: {min_idx}")
+    ax.set_title(f"Instance: {instance_name} | Solution: {sol_cost} | Best: {df.loc[min_idx]['global']} | Iteration: {min_idx}")
     ax.set_ylim(sol_cost - 10, df["local"].max() + 10)
     ax.set_xlim(-10, df.index[-1] + 10)
 
@@ -177,40 +422,27 @@ def plot(result_file: Annotated[str, typer.Option(help="The target run's .csv")]
 
 
 def read_folder(results_folder: Annotated[str, typer.Option(help="Directory containing results .csvs")]):
+    """Lê o resumo das execuções da pasta de resultados. Execuções que só têm o .csv (de antes da tabela de resumos) são
+    lidas uma única vez e registradas na tabela."""
     folder_path = os.path.join(os.getcwd(), results_folder)
-    files = sorted(os.listdir(folder_path))
-
-    cols = ["Instance", "Solution", "Best", "Time", "Iteration", "Tenure", "Frequency", "Invalid", "Invalid Tenure", "Invalid Frequency", "Invalid Invalid", "Gap", "Seed"]
-    all_df = pd.DataFrame()
-
-    for i in files:
-        instance_name, info = i.split("__")
-        instance = load_instance(instance_name)
-
-        df_path = os.path.join(folder_path, i)
-        df = pd.read_csv(df_path)
-
-        sol_cost = objective_function(instance.solution["routes"], instance.w)
-        sol_cost = instance.solution["cost"]
-
-        _, tenure, _, frequency, _, invalid, _, i_tenure, _, i_frequency, _, i_invalid, _, seed = info.removesuffix(".csv").split("_")
-
-        best = df.iloc[-1]["global"]
-        min_iteration = df["local"].idxmin()
-        min_time = df.iloc[min_iteration]["time"]
-        gap = (best - sol_cost) / sol_cost
-
-        all_df = pd.concat(
-            [
-                all_df,
-                pd.DataFrame(
-                    [[instance_name, sol_cost, best, min_time, min_iteration + 1, float(tenure), float(frequency), float(invalid), float(i_tenure), float(i_frequency), float(i_invalid), gap, seed]],
-                    columns=cols,
-                ),
-            ]
-        )
-
-    return all_df
+    # só as trajetórias, no formato instância__parâmetros.csv
+    files = sorted([i for i in os.listdir(folder_path) if "__" in i and i.endswith(".csv") and not i.endswith(PHASES_SUFFIX)])
+
+    results = read_results(folder_path)
+    missing = sorted(set(files) - set(results["output"]))
+    if missing:
+        # a melhor solução conhecida é lida uma vez por instância
+        bks = {}
+        for i in missing:
+            instance_name = i.split("__")[0]
+            if instance_name not in bks:
+                bks[instance_name] = load_instance(instance_name).solution["cost"]
+        save_records(folder_path, [csv_record(folder_path, i, bks[i.split("__")[0]]) for i in missing])
+        results = read_results(folder_path)
+
+    # execuções cujo .csv foi removido não entram na análise
+    results = results[results["output"].isin(files)]
+    return results[list(COLUMNS.values())].reset_index(drop=True)
 
 
 @app_experiment.command(help="Shows the parameter tuning tables")
@@ -0,0 +1,45 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+# opções que só mudam como a execução roda (medição do tempo, paralelismo, instrumentação e caches que não mudam os
+# movimentos escolhidos), e não o experimento; ficam fora do hash para que uma grade interrompida possa ser retomada
+# com outras opções de execução (por exemplo, com --workers > 1, que liga cpu_time)
+EXECUTION_OPTIONS = ("cpu_time", "neighborhood_workers", "instrument", "move_cache", "distance_cache")
+
+
+def job_key(instance_path: str, config: tuple, options: dict) -> str:
+    """Hash que identifica uma execução: instância, combinação de parâmetros (com a semente) e opções da busca."""
+    search_options = {k: v for k, v in options.items() if k not in EXECUTION_OPTIONS}
+    data = json.dumps({"instance": os.path.basename(instance_path), "config": list(config), **search_options}, sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class Manifest:
+    def __init__(self, results_folder: str, file_name: str = "manifest.jsonl"):
+        self.path: str = os.path.join(results_folder, file_name)
+        # último registro de cada execução
+        self.jobs: dict[str, dict] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        job = json.loads(line)
+                    except json.JSONDecodeError:
+                        # linha incompleta de uma execução interrompida
+                        continue
+                    self.jobs[job["key"]] = job
+
+    def is_done(self, key: str) -> bool:
+        job = self.jobs.get(key)
+        return job is not None and job["status"] == "done" and os.path.exists(job["output"])
+
+    def mark(self, key: str, status: str, instance_path: str, config: tuple, output: str = None):
+        """Registra o estado de uma execução ("started", "done" ou "failed")."""
+        job = {"key": key, "status": status, "instance": instance_path, "config": list(config), "output": output, "time": datetime.now().isoformat()}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(job) + "\n")
+        self.jobs[key] = job
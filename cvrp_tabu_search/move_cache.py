@@ -0,0 +1,74 @@
+import math
+import numpy as np
+from cvrp_tabu_search.problem import Instance, Solution, Move, MoveBatch
+from cvrp_tabu_search.neighborhoods import PAIRS
+
+
+class MoveCache:
+    """Movimentos de cada par de rotas das vizinhanças, guardados entre iterações.
+
+    Um movimento só muda duas rotas, então os movimentos dos demais pares continuam valendo: só os pares cujas rotas
+    mudaram são gerados de novo. Só a parte estática dos movimentos é guardada (custo, demandas, tamanhos e atributos);
+    tabu, frequências e penalidades mudam a cada iteração e são conferidos pela busca ao escolher o movimento.
+    """
+
+    def __init__(self):
+        # (vizinhança, i, j, accept_all) -> (rota i, rota j, custo da solução, movimentos, menor custo entre eles)
+        self.entries: dict[tuple, tuple[list[int], list[int], float, list, float]] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def supports(f) -> bool:
+        return f in PAIRS
+
+    def groups(self, f, s: Solution, p: Instance, accept_all: bool = False) -> list[tuple]:
+        """Entradas de cada par de rotas da vizinhança f, na ordem em que ela os percorre."""
+        pairs, pair_moves = PAIRS[f]
+        groups = []
+        for i, j in pairs(s, p):
+            key = (f.__name__, i, j, accept_all)
+            entry = self.entries.get(key)
+
+            # a entrada vale enquanto as duas rotas forem as mesmas; a solução corrente é alterada no lugar, então
+            # compara o conteúdo das rotas e não as listas
+            if entry is not None and entry[0] == s.s[i] and entry[1] == s.s[j]:
+                self.hits += 1
+            else:
+                self.misses += 1
+                items = pair_moves(s, p, i, j, accept_all)
+                items = [items] if isinstance(items, MoveBatch) else list(items)
+                entry = (s.s[i].copy(), s.s[j].copy(), s.f, items, lowest_cost(items))
+                self.entries[key] = entry
+
+            groups.append(entry)
+        return groups
+
+    @staticmethod
+    def lower_bound(entry: tuple, s: Solution) -> float:
+        """Menor custo entre os movimentos da entrada, na solução corrente."""
+        _, _, f_0, _, lowest = entry
+        return lowest + (s.f - f_0)
+
+    @staticmethod
+    def moves(entry: tuple, s: Solution) -> list:
+        """Movimentos da entrada, com o custo relativo à solução corrente."""
+        _, _, f_0, items, _ = entry
+        if f_0 == s.f:
+            return items
+        return [mv.offset(s.f - f_0) for mv in items]
+
+    def summary(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+def lowest_cost(items: list) -> float:
+    lowest = math.inf
+    for mv in items:
+        if isinstance(mv, MoveBatch):
+            if mv.valid.any():
+                lowest = min(lowest, np.min(mv.f[mv.valid]).item())
+        else:
+            mv: Move = mv
+            lowest = min(lowest, mv.f)
+    return lowest
@@ -0,0 +1,142 @@
+import os
+import json
+import math
+import time
+import random
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cvrp_tabu_search.problem import get_stopping, load_run_instance, Instance, Options, Run, Parameters, Solution
+from cvrp_tabu_search.tabu_search import run_tabu
+from cvrp_tabu_search.clarke_wright import clarke_wright
+from cvrp_tabu_search.constructive import sweep, nearest_neighbor
+
+# construtores usados, em ciclo, a partir do segundo início (o primeiro é sempre o Clarke-Wright determinístico)
+CONSTRUCTORS = ["savings", "sweep", "nearest_neighbor"]
+
+# intervalo do parâmetro de forma das economias aleatorizadas
+LAMBDA_RANGE = (0.5, 2.0)
+
+# custo da melhor solução encontrada entre todos os inícios, compartilhado entre os processos
+_shared_best = None
+
+
+def _init_shared(best):
+    global _shared_best
+    _shared_best = best
+
+
+def initial_solution(p: Instance, start: int, rng: random.Random, cw_top_k: int = None) -> tuple[str, float, Solution]:
+    """Gera a solução inicial de um início.
+
+    Returns:
+        tuple[str, float, Solution]: construtor usado, parâmetro de forma (None se não for economias) e a solução
+    """
+    if start == 0:
+        return "savings", 1.0, clarke_wright(p, cw_top_k)
+
+    method = CONSTRUCTORS[(start - 1) % len(CONSTRUCTORS)]
+    # sem coordenadas não há como ordenar pelo ângulo
+    if method == "sweep" and len(p.coords) == 0:
+        method = "nearest_neighbor"
+
+    if method == "savings":
+        lam = rng.uniform(*LAMBDA_RANGE)
+        return method, lam, clarke_wright(p, cw_top_k, lam)
+    if method == "sweep":
+        return method, None, sweep(p, rng)
+    return method, None, nearest_neighbor(p, rng)
+
+
+def is_valid(p: Instance, s: Solution) -> bool:
+    # bool do Python, para os resumos em .json (a sobrecapacidade pode ser um inteiro do numpy)
+    return bool(len(s) <= p.k and s.get_overcapacity(p.c) == 0)
+
+
+def share_best(p: Instance):
+    """Publica a melhor solução válida da execução no valor compartilhado e interrompe a busca quando algum início
+    alcançou a melhor solução conhecida."""
+    target = p.solution["cost"]
+    published = float("inf")
+
+    def callback(run: Run, s: Solution) -> bool:
+        nonlocal published
+        # a melhor solução começa como a inicial, que pode ter rotas demais
+        if run.best_solution.f < published and is_valid(p, run.best_solution):
+            published = run.best_solution.f
+            with _shared_best.get_lock():
+                _shared_best.value = min(_shared_best.value, published)
+        return _shared_best.value <= target
+
+    return callback
+
+
+def run_start(instance_path: str, config: tuple, start: int, results_folder: str, options: Options, deadline: float) -> dict:
+    """Executa a busca tabu de um início até o prazo comum do portfólio.
+
+    Returns:
+        dict: resumo do início
+    """
+    instance = load_run_instance(instance_path, options)
+    v_t, v_f, v_i, i_t, i_f, i_i, seed = config
+
+    # cada início tem sua própria semente, derivada da semente da configuração
+    start_seed = f"{seed}-{start}"
+    random.seed(start_seed)
+    method, lam, s = initial_solution(instance, start, random.Random(start_seed), options.cw_top_k)
+
+    valid_params = Parameters(instance.n, v_t, v_f, v_i)
+    invalid_params = Parameters(instance.n, i_t, i_f, i_i)
+
+    run = Run(s, instance.n, valid_params, invalid_params, seed)
+    run.savefile_suffix = run.savefile_suffix.removesuffix(".csv") + f"_start_{start}.csv"
+    run.begin_savefile(results_folder, instance.name, options.save_every, options.save_improvements)
+
+    run_tabu(instance, max(0.0, deadline - time.time()), run, s, options.invalid, options.batch, progress=False, callback=share_best(instance), stopping=get_stopping(options, instance))
+
+    return {
+        "start": start,
+        "method": method,
+        "lambda": lam,
+        "initial": s.f,
+        "best": run.best_solution.f,
+        "valid": is_valid(instance, run.best_solution),
+        "iterations": run.iteration,
+        "stop_reason": run.stop_reason,
+        "routes": [[int(v) for v in r] for r in run.best_solution.s],
+        "output": run.save_path,
+    }
+
+
+def run_portfolio(instance_path: str, config: tuple, results_folder: str, options: Options, starts: int, workers: int) -> dict:
+    """Executa vários inícios da busca tabu em paralelo para a mesma instância e combinação de parâmetros. Todos os
+    inícios param no mesmo prazo, options.run_time segundos (tempo real) após o começo do portfólio, ou sem prazo quando
+    run_time é nulo (os demais critérios de parada valem para cada início).
+
+    As trajetórias de cada início ficam em results_folder/starts; a do início vencedor é copiada para o caminho usual
+    da execução, junto de um .json com o resumo de todos os inícios.
+
+    Returns:
+        dict: resumo do portfólio
+    """
+    starts_folder = os.path.join(results_folder, "starts")
+    os.makedirs(starts_folder, exist_ok=True)
+
+    deadline = time.time() + options.run_time if options.run_time is not None else math.inf
+    best = multiprocessing.Value("d", float("inf"))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_shared, initargs=(best,)) as pool:
+        jobs = [pool.submit(run_start, instance_path, config, k, starts_folder, options, deadline) for k in range(starts)]
+        results = [job.result() for job in jobs]
+
+    # inícios que não encontraram solução válida só vencem se nenhum outro encontrou
+    winner = min(results, key=lambda r: (not r["valid"], r["best"], r["start"]))
+    file_name = os.path.basename(winner["output"]).removesuffix(f"_start_{winner['start']}.csv") + ".csv"
+    save_path = os.path.join(results_folder, file_name)
+    shutil.copyfile(winner["output"], save_path)
+
+    summary = {"instance": os.path.basename(instance_path), "config": list(config), "winner": winner["start"], "best": winner["best"], "output": save_path, "starts": results}
+    with open(save_path.removesuffix(".csv") + ".starts.json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
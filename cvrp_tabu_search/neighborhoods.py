@@ -1,7 +1,46 @@
 import numpy as np
-from copy import deepcopy
-from cvrp_tabu_search.problem import Solution, Instance
-from cvrp_tabu_search.utils import prev_vertex, next_vertex, get_route_demand
+from cvrp_tabu_search.problem import Solution, CompactSolution, Instance, Move, MoveBatch
+from cvrp_tabu_search.utils import prev_vertex, next_vertex
+
+
+def respects_capacity(kind: str, d_i, d_j, c: int):
+    """Regra de capacidade dos geradores (escalares ou arrays de um lote): o intraswap não muda a carga das rotas e o
+    shift só aumenta a da rota j."""
+    if kind == "intraswap":
+        return True
+    if kind == "shift":
+        return d_j <= c
+    return (d_i <= c) & (d_j <= c)
+
+
+def get_positions(s: Solution, p: Instance) -> CompactSolution:
+    """Retorna a solução em arrays, da qual positions.locate(v) dá a rota e a posição de cada cliente."""
+    positions = CompactSolution.from_solution(s, p.n)
+    positions.build_index()
+    return positions
+
+
+def adjacent_positions(s: Solution, positions: CompactSolution, x: int):
+    """Retorna as posições (rota, índice) dos itens adjacentes a x. Para o depósito, são as pontas de todas as rotas."""
+    if x == 0:
+        for j, r in enumerate(s.s):
+            if len(r) > 0:
+                yield j, 0
+                if len(r) > 1:
+                    yield j, len(r) - 1
+        return
+
+    j, m = positions.locate(x)
+    if m > 0:
+        yield j, m - 1
+    if m < len(s.s[j]) - 1:
+        yield j, m + 1
+
+
+def route_indices(s: Solution, routes: range = None) -> range:
+    """Rotas pivô percorridas por uma vizinhança: todas, ou só as do bloco dado quando a avaliação é dividida entre
+    processos."""
+    return range(len(s.s)) if routes is None else routes
 
 
 def update_objective_function_intraswap(w: np.ndarray, old_obj: np.int64, i: int, j: int, rv: list[int]):
@@ -14,61 +53,50 @@ def update_objective_function_intraswap(w: np.ndarray, old_obj: np.int64, i: int
     u1 = next_vertex(rv, j)
 
     # remove o custo de (v0, v) e (u, u1)
-    new_obj -= w[v0, v] + w[u, u1]
+    new_obj -= w.item(v0, v) + w.item(u, u1)
     # adiciona o custo de (v0, u) e (v, u1)
-    new_obj += w[v0, u] + w[v, u1]
+    new_obj += w.item(v0, u) + w.item(v, u1)
     # se estamos trocando dois índices adjacentes, não precisamos fazer nada
     # mas se são índices não-adjacentes, somamos normalmente
     if i + 1 != j:
-        new_obj -= w[v, v1] + w[u0, u]
-        new_obj += w[u, v1] + w[u0, v]
+        new_obj -= w.item(v, v1) + w.item(u0, u)
+        new_obj += w.item(u, v1) + w.item(u0, v)
 
     return new_obj
 
 
-def intraswap_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
-    # para cada item da rota...
-    for i in range(len(s.s)):
+def intraswap_pairs(s: Solution, p: Instance, routes: range = None):
+    """Rotas percorridas pelo intraswap, como pares (i, i)."""
+    for i in route_indices(s, routes):
         if len(s.s[i]) == 0:
             continue
 
-        for l, v in enumerate(s.s[i]):
-            for m, u in enumerate(s.s[i][l + 1 :], l + 1):
-                # cria uma cópia da solução
-                new_s = deepcopy(s)
+        yield i, i
 
-                # troca os itens
-                new_s.s[i].insert(l, u)
-                new_s.s[i].pop(l + 1)
-                new_s.s[i].insert(m, v)
-                new_s.s[i].pop(m + 1)
 
-                # atualiza o valor da função objetivo dinamicamente
-                new_s.f = update_objective_function_intraswap(p.w, s.f, l, m, s.s[i])
-                yield new_s, [(v, i), (u, i)]
+def intraswap_pair(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False):
+    # para cada item da rota...
+    for l, v in enumerate(s.s[i]):
+        for m, u in enumerate(s.s[i][l + 1 :], l + 1):
+            # atualiza o valor da função objetivo dinamicamente
+            new_f = update_objective_function_intraswap(p.w, s.f, l, m, s.s[i])
+            yield Move("intraswap", i, i, l, m, new_f, s.d[i], s.d[i], len(s.s[i]), len(s.s[i]), [(v, i), (u, i)])
 
 
-def update_objective_function_crossover(w: np.ndarray, old_obj: np.int64, i: int, j: int, rv: list[int], ru: list[int]):
-    new_obj = old_obj
-    v = rv[i]
-    u = ru[j]
-    v1 = next_vertex(rv, i)
-    u1 = next_vertex(ru, j)
-    # remove o custo da conexão entre as partes esquerda e direita de r1
-    new_obj -= w[v, v1]
-    # adiciona o custo da nova conexão com a direita de r2
-    new_obj += w[v, u1]
-    # remove o custo da conexão entre as partes esquerda e direita de r2
-    new_obj -= w[u, u1]
-    # adiciona o custo da nova conexão com a direita de r1
-    new_obj += w[u, v1]
+def intraswap_neighborhood(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    for i, j in intraswap_pairs(s, p, routes):
+        yield from intraswap_pair(s, p, i, j, accept_all)
 
-    return new_obj
 
+def apply_intraswap(s: Solution, mv: Move):
+    r = s.s[mv.i]
+    r[mv.l], r[mv.m] = r[mv.m], r[mv.l]
 
-def crossover_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
+
+def crossover_pairs(s: Solution, p: Instance, routes: range = None):
+    """Pares de rotas (i, j) percorridos pelo crossover."""
     # para cada combinação r0 x r1, em que r0 != r1
-    for i in range(len(s.s)):
+    for i in route_indices(s, routes):
         if len(s.s[i]) == 0:
             continue
 
@@ -79,42 +107,87 @@ def crossover_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
             if i == j:
                 continue
 
-            # para cada item da rota pivô, quebrar a rota no item (ex.: [v0, v] e [v1, v2...])
-            for l in range(1, len(s.s[i])):
-                # pega a demanda do lado direito de r1
-                r1_right_demand = get_route_demand(s.s[i][l:], p.d)
-
-                for m in range(1, len(s.s[j])):
-                    # pega a demanda do lado direito de r2
-                    r2_right_demand = get_route_demand(s.s[j][m:], p.d)
-
-                    # se os itens podem ser trocados de rota sem estourar a capacidade...
-                    new_r1_demand = s.d[i] - r1_right_demand + r2_right_demand
-                    new_r2_demand = s.d[j] + r1_right_demand - r2_right_demand
-
-                    if accept_all or (new_r1_demand <= p.c and new_r2_demand <= p.c):
-                        # cria uma cópia da solução
-                        new_s = deepcopy(s)
-
-                        # remove a parte da direita de r1 e coloca a direita de r2
-                        new_r1 = new_s.s[i][:l]
-                        new_r1.extend(new_s.s[j][m:])
+            yield i, j
+
+
+def crossover_pair(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False):
+    ri, rj = s.s[i], s.s[j]
+    # custo da aresta (u, u1) desfeita ao cortar r2 antes de cada posição, pelas distâncias acumuladas
+    cut_j = [s.edge_cost(j, m) for m in range(len(rj))]
+
+    # para cada item da rota pivô, quebrar a rota no item (ex.: [v0, v] e [v1, v2...])
+    for l in range(1, len(ri)):
+        # pega a demanda do lado direito de r1
+        r1_right_demand = s.tail_demand(i, l)
+        v, v1 = ri[l - 1], ri[l]
+        # remove o custo da conexão entre as partes esquerda e direita de r1
+        f_l = s.f - s.edge_cost(i, l)
+
+        for m in range(1, len(rj)):
+            # pega a demanda do lado direito de r2
+            r2_right_demand = s.tail_demand(j, m)
+
+            # se os itens podem ser trocados de rota sem estourar a capacidade...
+            new_r1_demand = s.d[i] - r1_right_demand + r2_right_demand
+            new_r2_demand = s.d[j] + r1_right_demand - r2_right_demand
+
+            if accept_all or (new_r1_demand <= p.c and new_r2_demand <= p.c):
+                # troca a conexão entre as partes de r2 pelas novas conexões com as partes direitas
+                new_f = f_l - cut_j[m] + p.w.item(v, rj[m]) + p.w.item(rj[m - 1], v1)
+                new_r1_len = l + len(rj) - m
+                new_r2_len = m + len(ri) - l
+                movement = [(o, j) for o in ri[l:]] + [(o, i) for o in rj[m:]]
+                yield Move("crossover", i, j, l, m, new_f, new_r1_demand, new_r2_demand, new_r1_len, new_r2_len, movement)
+
+
+def crossover_neighborhood(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    for i, j in crossover_pairs(s, p, routes):
+        yield from crossover_pair(s, p, i, j, accept_all)
+
+
+def crossover_neighborhood_granular(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    # só considera cortes que criam (v, u1) ou (u, v1) com uma aresta curta
+    positions = get_positions(s, p)
+    cuts = set()
+    for i, r in enumerate(s.s):
+        for l in range(1, len(r)):
+            v, v1 = r[l - 1], r[l]
+            for x in p.candidates[v]:
+                # x passa a ser o sucessor de v
+                if x != 0:
+                    j, m = positions.locate(x)
+                    if j != i and m > 0:
+                        cuts.add((i, j, l, m))
+            for x in p.candidates[v1]:
+                # x passa a ser o predecessor de v1
+                if x != 0:
+                    j, m = positions.locate(x)
+                    if j != i and m < len(s.s[j]) - 1:
+                        cuts.add((i, j, l, m + 1))
+
+    for i, j, l, m in sorted(cuts):
+        if routes is not None and i not in routes:
+            continue
 
-                        # remove a parte da direita de r2 e coloca a direita de r1
-                        new_r2 = new_s.s[j][:m]
-                        new_r2.extend(new_s.s[i][l:])
+        r1_right_demand = s.tail_demand(i, l)
+        r2_right_demand = s.tail_demand(j, m)
+        new_r1_demand = s.d[i] - r1_right_demand + r2_right_demand
+        new_r2_demand = s.d[j] + r1_right_demand - r2_right_demand
 
-                        # atualiza as rotas
-                        new_s.s[i] = new_r1
-                        new_s.s[j] = new_r2
+        if accept_all or (new_r1_demand <= p.c and new_r2_demand <= p.c):
+            # as arestas desfeitas pelos cortes saem das distâncias acumuladas
+            new_f = s.f - s.edge_cost(i, l) - s.edge_cost(j, m) + p.w.item(s.s[i][l - 1], s.s[j][m]) + p.w.item(s.s[j][m - 1], s.s[i][l])
+            new_r1_len = l + len(s.s[j]) - m
+            new_r2_len = m + len(s.s[i]) - l
+            movement = [(o, j) for o in s.s[i][l:]] + [(o, i) for o in s.s[j][m:]]
+            yield Move("crossover", i, j, l, m, new_f, new_r1_demand, new_r2_demand, new_r1_len, new_r2_len, movement)
 
-                        # atualiza o valor das capacidades dinamicamente
-                        new_s.d[i] = new_r1_demand
-                        new_s.d[j] = new_r2_demand
 
-                        # atualiza o valor da função objetivo dinamicamente
-                        new_s.f = update_objective_function_crossover(p.w, s.f, l - 1, m - 1, s.s[i], s.s[j])
-                        yield new_s, [(o, j) for o in s.s[i][l:]] + [(o, i) for o in s.s[j][m:]]
+def apply_crossover(s: Solution, mv: Move):
+    # troca a parte da direita de r1 com a parte da direita de r2
+    r1, r2 = s.s[mv.i], s.s[mv.j]
+    s.s[mv.i] = r1[: mv.l] + r2[mv.m :]
+    s.s[mv.j] = r2[: mv.m] + r1[mv.l :]
 
 
 def update_objective_function_swap(w: np.ndarray, old_obj: np.int64, i: int, j: int, rv: list[int], ru: list[int]):
@@ -126,19 +199,20 @@ def update_objective_function_swap(w: np.ndarray, old_obj: np.int64, i: int, j:
     u0 = prev_vertex(ru, j)
     u1 = next_vertex(ru, j)
     # remove o custo de (v0, v) e (v, v1)
-    new_obj -= w[v0, v] + w[v, v1]
+    new_obj -= w.item(v0, v) + w.item(v, v1)
     # adiciona o custo de (v0, u) e (u, v1)
-    new_obj += w[v0, u] + w[u, v1]
+    new_obj += w.item(v0, u) + w.item(u, v1)
     # remove o custo de (u0, u) e (u, u1)
-    new_obj -= w[u0, u] + w[u, u1]
+    new_obj -= w.item(u0, u) + w.item(u, u1)
     # adiciona o custo de (u0, v) e (v, u1)
-    new_obj += w[u0, v] + w[v, u1]
+    new_obj += w.item(u0, v) + w.item(v, u1)
     return new_obj
 
 
-def swap_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
+def swap_pairs(s: Solution, p: Instance, routes: range = None):
+    """Pares de rotas (i, j) percorridos pelo swap."""
     # para cada combinação r0 x r1, em que idx(r0) < idx(r1)
-    for i in range(len(s.s)):
+    for i in route_indices(s, routes):
         if len(s.s[i]) == 0:
             continue
 
@@ -146,56 +220,123 @@ def swap_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
             if len(s.s[j]) == 0:
                 continue
 
-            # para cada item da rota pivô, ver se pode ser inserida em todas as posições de todas as outras rotas
-            for l, v in enumerate(s.s[i]):
-                v_demand = p.d[v]
-                for m, u in enumerate(s.s[j]):
-                    u_demand = p.d[u]
+            yield i, j
+
+
+def swap_pair(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False):
+    # para cada item da rota pivô, ver se pode ser inserida em todas as posições de todas as outras rotas
+    for l, v in enumerate(s.s[i]):
+        v_demand = p.d[v]
+        for m, u in enumerate(s.s[j]):
+            u_demand = p.d[u]
+
+            # se os itens podem ser trocados de rota sem estourar a capacidade...
+            new_i_demand = s.d[i] - v_demand + u_demand
+            new_j_demand = s.d[j] + v_demand - u_demand
+
+            if accept_all or (new_j_demand <= p.c and new_i_demand <= p.c):
+                # atualiza o valor da função objetivo dinamicamente
+                new_f = update_objective_function_swap(p.w, s.f, l, m, s.s[i], s.s[j])
+                yield Move("swap", i, j, l, m, new_f, new_i_demand, new_j_demand, len(s.s[i]), len(s.s[j]), [(v, j), (u, i)])
+
+
+def swap_neighborhood(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    for i, j in swap_pairs(s, p, routes):
+        yield from swap_pair(s, p, i, j, accept_all)
+
+
+def swap_neighborhood_granular(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    # só considera trocas em que v ou u passa a ser adjacente a um de seus vizinhos próximos
+    positions = get_positions(s, p)
+    pairs = set()
+    for i, r in enumerate(s.s):
+        for l, v in enumerate(r):
+            for x in p.candidates[v]:
+                # v entra no lugar de um item adjacente a x
+                for j, m in adjacent_positions(s, positions, x):
+                    if i < j:
+                        pairs.add((i, j, l, m))
+                    elif j < i:
+                        pairs.add((j, i, m, l))
+
+    for i, j, l, m in sorted(pairs):
+        if routes is not None and i not in routes:
+            continue
+
+        v, u = s.s[i][l], s.s[j][m]
+        new_i_demand = s.d[i] - p.d[v] + p.d[u]
+        new_j_demand = s.d[j] + p.d[v] - p.d[u]
+
+        if accept_all or (new_j_demand <= p.c and new_i_demand <= p.c):
+            new_f = update_objective_function_swap(p.w, s.f, l, m, s.s[i], s.s[j])
+            yield Move("swap", i, j, l, m, new_f, new_i_demand, new_j_demand, len(s.s[i]), len(s.s[j]), [(v, j), (u, i)])
+
+
+def apply_swap(s: Solution, mv: Move):
+    # troca o item da rota 1 com o item da rota 2
+    s.s[mv.i][mv.l], s.s[mv.j][mv.m] = s.s[mv.j][mv.m], s.s[mv.i][mv.l]
+
+
+def neighbor_arrays(r: list[int]):
+    """Retorna a rota e seus predecessores e sucessores, com o depósito nas pontas."""
+    rv = np.array(r)
+    padded = np.concatenate(([0], rv, [0]))
+    return rv, padded[:-2], padded[2:]
 
-                    # se os itens podem ser trocados de rota sem estourar a capacidade...
-                    new_i_demand = s.d[i] - v_demand + u_demand
-                    new_j_demand = s.d[j] + v_demand - u_demand
 
-                    if accept_all or (new_j_demand <= p.c and new_i_demand <= p.c):
-                        # cria uma cópia da solução
-                        new_s = deepcopy(s)
+def swap_pair_batch(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False) -> MoveBatch:
+    """Todos os swaps entre as rotas i e j."""
+    rv, v0, v1 = neighbor_arrays(s.s[i])
+    v_demand = p.d[rv][:, None]
+    # custo de remover cada item da rota i
+    v_removal = p.w[v0, rv] + p.w[rv, v1]
 
-                        # remove o item da rota 1 e adiciona o item da rota 2
-                        new_s.s[i].insert(l, u)
-                        new_s.s[i].remove(v)
+    ru, u0, u1 = neighbor_arrays(s.s[j])
+    u_demand = p.d[ru][None, :]
+    u_removal = p.w[u0, ru] + p.w[ru, u1]
 
-                        # remove o item da rota 2 e adiciona o item da rota 1
-                        new_s.s[j].insert(m, v)
-                        new_s.s[j].remove(u)
+    new_i_demand = s.d[i] - v_demand + u_demand
+    new_j_demand = s.d[j] + v_demand - u_demand
+    valid = np.full(new_i_demand.shape, True) if accept_all else (new_i_demand <= p.c) & (new_j_demand <= p.c)
+    if p.candidate_mask is not None:
+        cm = p.candidate_mask
+        valid = valid & (cm[v0[:, None], ru[None, :]] | cm[ru[None, :], v1[:, None]] | cm[u0[None, :], rv[:, None]] | cm[rv[:, None], u1[None, :]])
 
-                        # atualiza o valor das capacidades dinamicamente
-                        new_s.d[i] = new_i_demand
-                        new_s.d[j] = new_j_demand
+    # u entra no lugar de v e v entra no lugar de u
+    f = s.f - v_removal[:, None] - u_removal[None, :]
+    f = f + p.w[v0[:, None], ru[None, :]] + p.w[ru[None, :], v1[:, None]]
+    f = f + p.w[u0[None, :], rv[:, None]] + p.w[rv[:, None], u1[None, :]]
 
-                        # atualiza o valor da função objetivo dinamicamente
-                        new_s.f = update_objective_function_swap(p.w, s.f, l, m, s.s[i], s.s[j])
-                        yield new_s, [(v, j), (u, i)]
+    return MoveBatch("swap", i, j, f, valid, new_i_demand, new_j_demand, len(rv), len(ru), rv, ru)
 
 
-def update_objective_function_shift(w: np.ndarray, old_obj: np.int64, i: int, j: int, rv: list[int], rnv: list[int]):
+def swap_neighborhood_batch(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    # mesma vizinhança do swap, mas avaliada de uma vez para cada par de rotas
+    for i, j in swap_pairs(s, p, routes):
+        yield swap_pair_batch(s, p, i, j, accept_all)
+
+
+def update_objective_function_shift(w: np.ndarray, old_obj: np.int64, i: int, j: int, rv: list[int], ru: list[int]):
     new_obj = old_obj
     v = rv[i]
     v0 = prev_vertex(rv, i)
     v1 = next_vertex(rv, i)
-    u0 = prev_vertex(rnv, j)
-    u1 = next_vertex(rnv, j)
-    new_obj -= w[v0, v] + w[v, v1]
+    # vizinhos da posição j de inserção em ru (antes da inserção)
+    u0 = prev_vertex(ru, j)
+    u1 = ru[j] if j < len(ru) else 0
+    new_obj -= w.item(v0, v) + w.item(v, v1)
     # caso a rota seja vazia
     if v0 != v1:
-        new_obj += w[v0, v1]
-    new_obj += w[u0, v] + w[v, u1]
-    new_obj -= w[u0, u1]
+        new_obj += w.item(v0, v1)
+    new_obj += w.item(u0, v) + w.item(v, u1)
+    new_obj -= w.item(u0, u1)
     return new_obj
 
 
-def shift_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
+def shift_pairs(s: Solution, p: Instance, routes: range = None):
+    """Pares de rotas (i, j) percorridos pelo shift."""
     # para cada combinação r0 x r1, em que r0 != r1
-    for i in range(len(s.s)):
+    for i in route_indices(s, routes):
         if len(s.s[i]) == 0:
             continue
 
@@ -209,29 +350,130 @@ def shift_neighborhood(s: Solution, p: Instance, accept_all: bool = False):
             if i == j:
                 continue
 
-            # para cada item da rota pivô, ver se pode ser inserida em todas as posições de todas as outras rotas
-            for l, v in enumerate(s.s[i]):
-                v_demand = p.d[v]
+            yield i, j
 
-                # se o item pode ser inserido na rota j sem estourar a capacidade...
-                new_j_demand = s.d[j] + v_demand
 
+def shift_pair(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False):
+    ri, rj = s.s[i], s.s[j]
+    # custo da aresta (u0, u1) desfeita ao inserir em cada posição da rota j, pelas distâncias acumuladas; a última
+    # posição fica antes da volta ao depósito
+    insertion_j = [s.edge_cost(j, k) for k in range(len(rj))] + [p.w.item(rj[-1], 0) if rj else 0]
+
+    # para cada item da rota pivô, ver se pode ser inserida em todas as posições de todas as outras rotas
+    for l, v in enumerate(ri):
+        v_demand = p.d[v]
+
+        # se o item pode ser inserido na rota j sem estourar a capacidade...
+        new_j_demand = s.d[j] + v_demand
+
+        if accept_all or new_j_demand <= p.c:
+            # remove v da rota i, ligando o anterior ao próximo (caso a rota não fique vazia)
+            v0 = ri[l - 1] if l > 0 else 0
+            v1 = ri[l + 1] if l + 1 < len(ri) else 0
+            f_l = s.f - s.edge_cost(i, l) - (s.edge_cost(i, l + 1) if l + 1 < len(ri) else p.w.item(v, 0))
+            if v0 != v1:
+                f_l += p.w.item(v0, v1)
+
+            # para cada lugar possível de inserir o ponto na rota
+            for k in range(len(rj) + 1):
+                u0 = rj[k - 1] if k > 0 else 0
+                u1 = rj[k] if k < len(rj) else 0
+                new_f = f_l + p.w.item(u0, v) + p.w.item(v, u1) - insertion_j[k]
+                yield Move("shift", i, j, l, k, new_f, s.d[i] - v_demand, new_j_demand, len(ri) - 1, len(rj) + 1, [(v, j)])
+
+
+def shift_neighborhood(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    for i, j in shift_pairs(s, p, routes):
+        yield from shift_pair(s, p, i, j, accept_all)
+
+
+def shift_neighborhood_granular(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    # só considera inserções em que v passa a ser adjacente a um de seus vizinhos próximos
+    positions = get_positions(s, p)
+    for i in route_indices(s, routes):
+        if len(s.s[i]) == 0:
+            continue
+
+        if len(s.s[i]) == 1 and p.k == len(s):
+            continue
+
+        for l, v in enumerate(s.s[i]):
+            v_demand = p.d[v]
+
+            # inserir logo antes ou logo depois de x cria a aresta (v, x) ou (x, v)
+            insertions = set()
+            for x in p.candidates[v]:
+                if x == 0:
+                    insertions.update((j, k) for j, r in enumerate(s.s) if len(r) > 0 for k in (0, len(r)))
+                else:
+                    j, m = positions.locate(x)
+                    insertions.update([(j, m), (j, m + 1)])
+
+            for j, k in sorted(insertions):
+                if j == i:
+                    continue
+
+                new_j_demand = s.d[j] + v_demand
                 if accept_all or new_j_demand <= p.c:
-                    # para cada lugar possível de inserir o ponto na rota
-                    for k in range(len(s.s[j]) + 1):
-                        # cria uma cópia da solução
-                        new_s = deepcopy(s)
+                    new_f = update_objective_function_shift(p.w, s.f, l, k, s.s[i], s.s[j])
+                    yield Move("shift", i, j, l, k, new_f, s.d[i] - v_demand, new_j_demand, len(s.s[i]) - 1, len(s.s[j]) + 1, [(v, j)])
+
+
+def shift_pair_batch(s: Solution, p: Instance, i: int, j: int, accept_all: bool = False) -> MoveBatch:
+    """Todos os shifts de um item da rota i para a rota j."""
+    rv, v0, v1 = neighbor_arrays(s.s[i])
+    v_demand = p.d[rv][:, None]
+    # custo de remover cada item da rota i (ligando o anterior ao próximo, se a rota não ficar vazia)
+    v_removal = p.w[v0, rv] + p.w[rv, v1] - np.where(v0 != v1, p.w[v0, v1], 0)
+
+    # posições de inserção na rota j: entre (u0[k], u1[k]) para k em 0..len(rota j)
+    ru = np.array(s.s[j])
+    u0 = np.concatenate(([0], ru))
+    u1 = np.concatenate((ru, [0]))
+
+    new_j_demand = np.broadcast_to(s.d[j] + v_demand, (len(rv), len(u0)))
+    new_i_demand = np.broadcast_to(s.d[i] - v_demand, new_j_demand.shape)
+    valid = np.full(new_j_demand.shape, True) if accept_all else new_j_demand <= p.c
+    if p.candidate_mask is not None:
+        valid = valid & (p.candidate_mask[u0[None, :], rv[:, None]] | p.candidate_mask[rv[:, None], u1[None, :]])
+
+    f = s.f - v_removal[:, None] + p.w[u0[None, :], rv[:, None]] + p.w[rv[:, None], u1[None, :]] - p.w[u0, u1][None, :]
+
+    return MoveBatch("shift", i, j, f, valid, new_i_demand, new_j_demand, len(rv) - 1, len(ru) + 1, rv)
+
+
+def shift_neighborhood_batch(s: Solution, p: Instance, accept_all: bool = False, routes: range = None):
+    # mesma vizinhança do shift, mas avaliada de uma vez para cada par de rotas
+    for i, j in shift_pairs(s, p, routes):
+        yield shift_pair_batch(s, p, i, j, accept_all)
+
+
+def apply_shift(s: Solution, mv: Move):
+    # remove o item da rota antiga e insere no ponto m da nova rota
+    s.s[mv.j].insert(mv.m, s.s[mv.i].pop(mv.l))
+
+
+# pares de rotas de cada vizinhança e os movimentos de um par (lote, nas vizinhanças em lote), usados pelo cache de
+# movimentos
+PAIRS = {
+    shift_neighborhood: (shift_pairs, shift_pair),
+    intraswap_neighborhood: (intraswap_pairs, intraswap_pair),
+    swap_neighborhood: (swap_pairs, swap_pair),
+    crossover_neighborhood: (crossover_pairs, crossover_pair),
+    shift_neighborhood_batch: (shift_pairs, shift_pair_batch),
+    swap_neighborhood_batch: (swap_pairs, swap_pair_batch),
+}
+
+APPLY = {"shift": apply_shift, "intraswap": apply_intraswap, "swap": apply_swap, "crossover": apply_crossover}
 
-                        # remove o item da rota antiga
-                        new_s.s[i].remove(v)
 
-                        # cria uma nova solução com o vértice no ponto k da rota
-                        new_s.s[j].insert(k, v)
+def apply_move(s: Solution, mv: Move, p: Instance):
+    """Aplica o movimento na solução, sem cópias."""
+    APPLY[mv.kind](s, mv)
+    s.f = mv.f
 
-                        # atualiza o valor das capacidades dinamicamente
-                        new_s.d[i] -= v_demand
-                        new_s.d[j] = new_j_demand
+    # as rotas só mudam a partir das posições l e m
+    s.update_route(mv.i, mv.d_i, mv.l, p.d, p.w)
+    if mv.j != mv.i:
+        s.update_route(mv.j, mv.d_j, mv.m, p.d, p.w)
 
-                        # atualiza o valor da função objetivo dinamicamente
-                        new_s.f = update_objective_function_shift(p.w, s.f, l, k, s.s[i], new_s.s[j])
-                        yield new_s, [(v, j)]
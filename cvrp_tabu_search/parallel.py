@@ -0,0 +1,96 @@
+import math
+import numpy as np
+from itertools import repeat
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from cvrp_tabu_search.problem import Instance, Solution, Run, Move
+
+# blocos de rotas pivô por processo; mais blocos que processos equilibram a carga entre eles
+CHUNKS_PER_WORKER = 2
+
+# instância montada em cada processo sobre a memória compartilhada
+_instance: Instance = None
+# os blocos de memória precisam continuar abertos enquanto os arrays forem usados
+_shared: list[shared_memory.SharedMemory] = []
+
+
+def share_array(a: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple]:
+    """Copia o array para um bloco de memória compartilhada e retorna o bloco e a descrição usada para abri-lo."""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+    np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[:] = a
+    return shm, (shm.name, a.shape, a.dtype.str)
+
+
+def attach_array(spec: tuple) -> np.ndarray:
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    _shared.append(shm)
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(fields: dict, arrays: dict):
+    global _instance
+    _instance = Instance()
+    for k, v in fields.items():
+        setattr(_instance, k, v)
+    for k, spec in arrays.items():
+        setattr(_instance, k, attach_array(spec))
+
+
+def _search(search, structure_list: list, s: Solution, run: Run, accept_all: bool, routes: range) -> tuple[Move, float]:
+    return search(structure_list, s, _instance, run, accept_all, routes)
+
+
+class NeighborhoodPool:
+    """Processos persistentes que dividem a avaliação de uma vizinhança em blocos de rotas pivô. As matrizes da instância
+    ficam em memória compartilhada, então cada iteração só envia a solução corrente e o estado tabu.
+
+    Cada bloco devolve o seu melhor movimento e os resultados são reduzidos na ordem dos blocos, mantendo o primeiro em
+    caso de empate, o que escolhe o mesmo movimento da avaliação serial, independente do número de processos.
+    """
+
+    def __init__(self, p: Instance, workers: int):
+        self.workers: int = workers
+        self.shared: list[shared_memory.SharedMemory] = []
+
+        fields = {k: getattr(p, k) for k in ("name", "c", "depot_idx", "n", "k", "candidates")}
+        arrays = {}
+        for k in ("w", "d", "candidate_mask"):
+            if getattr(p, k) is None:
+                continue
+            if not isinstance(getattr(p, k), np.ndarray):
+                # distâncias calculadas sob demanda só guardam as coordenadas, que vão junto com os demais campos
+                fields[k] = getattr(p, k)
+                continue
+            shm, arrays[k] = share_array(np.ascontiguousarray(getattr(p, k)))
+            self.shared.append(shm)
+
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(fields, arrays))
+
+    def search(self, search, structure_list: list, s: Solution, run: Run, accept_all: bool = False) -> Move:
+        """Executa search (find_best_neighbor ou find_best_neighbor_batch) dividida entre os processos."""
+        n_chunks = min(len(s.s), self.workers * CHUNKS_PER_WORKER)
+        chunks = [range(c[0], c[-1] + 1) for c in np.array_split(np.arange(len(s.s)), n_chunks)]
+
+        best_move: Move = None
+        best_f: float = math.inf
+        # map devolve os resultados na ordem dos blocos
+        for mv, f in self.executor.map(_search, repeat(search), repeat(structure_list), repeat(s), repeat(run.snapshot()), repeat(accept_all), chunks):
+            if best_f > f:
+                best_move = mv
+                best_f = f
+
+        return best_move
+
+    def close(self):
+        self.executor.shutdown()
+        for shm in self.shared:
+            shm.close()
+            shm.unlink()
+        self.shared = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,8 +1,12 @@
-import vrplib
+import json
 import numpy as np
 import pandas as pd
-from math import log10
+from math import log10, inf
+from collections import Counter
+from itertools import chain, accumulate
 from cvrp_tabu_search.utils import get_route_demand, objective_function
+from cvrp_tabu_search.cache import load_instance_data
+from cvrp_tabu_search.distances import parse_lazy_instance
 
 
 class Solution:
@@ -11,22 +15,276 @@ class Solution:
         self.d: list[int] = [get_route_demand(r, d) for r in s]
         self.f: int = f if f else objective_function(s, w)
 
+        # demanda e distância acumuladas de cada rota: cd[r][k] e cw[r][k] consideram os k primeiros itens
+        self.cd: list[list[int]] = [[0] for _ in s]
+        self.cw: list[list[float]] = [[0] for _ in s]
+        for r in range(len(s)):
+            self.update_prefix(r, 0, d, w)
+
+        # tamanho de cada rota, quantas rotas têm cada tamanho e número de rotas não vazias, mantidos a cada movimento
+        # para que as penalidades de um vizinho sejam calculadas sem percorrer as rotas
+        self.lengths: list[int] = [len(r) for r in s]
+        self.length_count: Counter = Counter(self.lengths)
+        self.k: int = len(s) - self.length_count[0]
+        self.min_length: int = min(self.lengths, default=0)
+        # sobrecapacidade total, para a capacidade da última consulta (None enquanto não for consultada)
+        self.capacity: int = None
+        self.overcapacity: int = 0
+
+    def update_route(self, r: int, demand: int, start: int, d: np.ndarray, w: np.ndarray):
+        """Atualiza a demanda, o tamanho e as somas acumuladas da rota r, alterada a partir da posição start."""
+        if self.capacity is not None:
+            self.overcapacity += max(0, demand - self.capacity) - max(0, self.d[r] - self.capacity)
+        self.d[r] = demand
+
+        old_len, new_len = self.lengths[r], len(self.s[r])
+        if old_len != new_len:
+            self.length_count[old_len] -= 1
+            self.length_count[new_len] += 1
+            self.k += (new_len > 0) - (old_len > 0)
+            self.lengths[r] = new_len
+
+            # a menor rota só aumenta quando a última rota com o menor tamanho cresce
+            if new_len < self.min_length:
+                self.min_length = new_len
+            while self.length_count[self.min_length] == 0:
+                self.min_length += 1
+
+        self.update_prefix(r, start, d, w)
+
+    def update_prefix(self, r: int, start: int, d: np.ndarray, w: np.ndarray):
+        """Recalcula as somas acumuladas da rota r a partir da posição start."""
+        route = self.s[r]
+        cd = self.cd[r][: start + 1]
+        cw = self.cw[r][: start + 1]
+        for k in range(start, len(route)):
+            cd.append(cd[-1] + d[route[k]])
+            cw.append(cw[-1] + w.item(route[k - 1] if k > 0 else 0, route[k]))
+        self.cd[r] = cd
+        self.cw[r] = cw
+
+    def tail_demand(self, r: int, l: int):
+        return self.d[r] - self.cd[r][l]
+
+    def edge_cost(self, r: int, k: int):
+        """Custo da aresta que chega ao item da posição k da rota r (vinda do depósito quando k = 0)."""
+        return self.cw[r][k + 1] - self.cw[r][k]
+
     def get_overcapacity(self, max_c: int):
-        return sum([max(0, i - max_c) for i in self.d])
+        if self.capacity != max_c:
+            self.capacity = max_c
+            self.overcapacity = sum([max(0, i - max_c) for i in self.d])
+        return self.overcapacity
+
+    def copy(self):
+        new_s = Solution.__new__(Solution)
+        new_s.s = [r.copy() for r in self.s]
+        new_s.d = self.d.copy()
+        new_s.f = self.f
+        new_s.cd = [c.copy() for c in self.cd]
+        new_s.cw = [c.copy() for c in self.cw]
+        new_s.lengths = self.lengths.copy()
+        new_s.length_count = self.length_count.copy()
+        new_s.k = self.k
+        new_s.min_length = self.min_length
+        new_s.capacity = self.capacity
+        new_s.overcapacity = self.overcapacity
+        return new_s
+
+    def restore(self, other: "Solution"):
+        """Substitui o conteúdo da solução pelo de outra. A lista de rotas é alterada no lugar, para que referências a
+        ela continuem válidas."""
+        self.s[:] = [r.copy() for r in other.s]
+        self.d = other.d.copy()
+        self.f = other.f
+        self.cd = [c.copy() for c in other.cd]
+        self.cw = [c.copy() for c in other.cw]
+        self.lengths = other.lengths.copy()
+        self.length_count = other.length_count.copy()
+        self.k = other.k
+        self.min_length = other.min_length
+        self.capacity = other.capacity
+        self.overcapacity = other.overcapacity
+
+    def min_length_except(self, i: int, j: int):
+        """Tamanho da menor rota, sem contar as rotas i e j."""
+        if len(self.s) <= (1 if i == j else 2):
+            return inf
+
+        length = self.min_length
+        while True:
+            count = self.length_count[length] - (self.lengths[i] == length)
+            if i != j:
+                count -= self.lengths[j] == length
+            if count > 0:
+                return length
+            length += 1
+
+    def route_stats(self, i: int, len_i: int, j: int, len_j: int):
+        """Calcula número de rotas e tamanho da menor rota caso as rotas i e j passem a ter os tamanhos dados."""
+        k = self.k + (len_i > 0) - (self.lengths[i] > 0)
+        if i != j:
+            k += (len_j > 0) - (self.lengths[j] > 0)
+        return k, min(len_i, len_j, self.min_length_except(i, j))
+
+    def evaluate(self, mv: "Move", max_c: int):
+        """Calcula número de rotas, menor rota e sobrecapacidade da solução após o movimento, sem aplicá-lo."""
+        k, min_len = self.route_stats(mv.i, mv.len_i, mv.j, mv.len_j)
+        overcapacity = self.get_overcapacity(max_c) - max(0, self.d[mv.i] - max_c) + max(0, mv.d_j - max_c)
+        if mv.i != mv.j:
+            overcapacity += max(0, mv.d_i - max_c) - max(0, self.d[mv.j] - max_c)
+        return k, min_len, overcapacity
 
     def __str__(self):
         return str(self.s)
 
     def __len__(self):
-        return ([len(i) > 0 for i in self.s]).count(True)
+        return self.k
 
     def min(self):
-        return min([len(i) for i in self.s])
+        return self.min_length
+
+
+class CompactSolution:
+    """Solução guardada em arrays: as rotas concatenadas em um único tour, com o início de cada rota em offsets, e a rota
+    e a posição de cada cliente (-1 para o depósito), montadas na primeira consulta a locate.
+
+    É o formato das soluções do pool de elite da busca cooperativa, que são copiadas entre processos a cada troca: um
+    array é serializado de uma vez, enquanto uma lista de rotas é serializada cliente a cliente. As vizinhanças
+    granulares também a usam para achar a posição dos vizinhos de cada cliente.
+
+    O texto da solução é o mesmo de Solution (a coluna solution dos .csv), que parse lê de volta.
+    """
+
+    __slots__ = ("tour", "offsets", "f", "n", "route_of", "position_of")
+
+    def __init__(self, routes: list[list[int]], f: float, n: int = None):
+        bounds = list(accumulate([len(r) for r in routes], initial=0))
+        self.tour: np.ndarray = np.fromiter(chain.from_iterable(routes), dtype=np.int32, count=bounds[-1])
+        self.offsets: np.ndarray = np.array(bounds, dtype=np.int32)
+        self.f: float = f
+        # número de vértices da instância, o tamanho dos índices (por padrão, até o maior cliente da solução)
+        self.n: int = n
+        self.route_of: np.ndarray = None
+        self.position_of: np.ndarray = None
+
+    @classmethod
+    def from_solution(cls, s: Solution, n: int = None) -> "CompactSolution":
+        """Solução com as mesmas rotas de s, inclusive as vazias, para que os índices das rotas sejam os mesmos."""
+        return cls(s.s, s.f, n)
+
+    @classmethod
+    def parse(cls, text: str, p: "Instance") -> "CompactSolution":
+        """Lê a solução no formato da coluna solution dos .csv."""
+        routes = json.loads(text)
+        return cls(routes, objective_function([r for r in routes if r], p.w), p.n)
+
+    @classmethod
+    def from_bytes(cls, tour: bytes, offsets: bytes, f: float) -> "CompactSolution":
+        new_s = cls.__new__(cls)
+        new_s.tour = np.frombuffer(tour, dtype=np.int32)
+        new_s.offsets = np.frombuffer(offsets, dtype=np.int32)
+        new_s.f = f
+        new_s.n = None
+        new_s.route_of = None
+        new_s.position_of = None
+        return new_s
+
+    def __reduce__(self):
+        # serializa os arrays como bytes, sem o custo fixo do pickle de cada array do numpy; os índices são refeitos
+        return CompactSolution.from_bytes, (self.tour.tobytes(), self.offsets.tobytes(), self.f)
+
+    def to_solution(self, d: np.ndarray, w: np.ndarray, routes: int = 0) -> Solution:
+        """Solução com as mesmas rotas, completada com rotas vazias ao final até ter ao menos routes rotas."""
+        s = self.s
+        return Solution(s + [[] for _ in range(routes - len(s))], d, w, self.f)
+
+    @property
+    def s(self) -> list[list[int]]:
+        bounds = self.offsets.tolist()
+        tour = self.tour.tolist()
+        return [tour[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    def build_index(self):
+        n = self.n if self.n is not None else (int(self.tour.max()) + 1 if len(self.tour) else 1)
+        lengths = np.diff(self.offsets)
+        route = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+        self.route_of = np.full(n, -1, dtype=np.int32)
+        self.route_of[self.tour] = route
+        self.position_of = np.full(n, -1, dtype=np.int32)
+        self.position_of[self.tour] = np.arange(len(self.tour), dtype=np.int32) - self.offsets[route]
+
+    def locate(self, v: int) -> tuple[int, int]:
+        """Rota e posição do cliente v."""
+        if self.route_of is None:
+            self.build_index()
+        return self.route_of.item(v), self.position_of.item(v)
+
+    def same_routes(self, other: "CompactSolution") -> bool:
+        return np.array_equal(self.offsets, other.offsets) and np.array_equal(self.tour, other.tour)
+
+    def __str__(self):
+        return str(self.s)
+
+
+class Move:
+    def __init__(self, kind: str, i: int, j: int, l: int, m: int, f: float, d_i: int, d_j: int, len_i: int, len_j: int, movement: list[tuple[int, int]]):
+        # tipo da vizinhança que gerou o movimento
+        self.kind: str = kind
+        # índices das rotas e posições envolvidas
+        self.i: int = i
+        self.j: int = j
+        self.l: int = l
+        self.m: int = m
+        # valor da função objetivo após o movimento
+        self.f: float = f
+        # demandas e tamanhos das rotas i e j após o movimento
+        self.d_i: int = d_i
+        self.d_j: int = d_j
+        self.len_i: int = len_i
+        self.len_j: int = len_j
+        # atributos tabu (cliente, rota destino)
+        self.movement: list[tuple[int, int]] = movement
+
+    def offset(self, delta: float) -> "Move":
+        """Mesmo movimento, com a função objetivo deslocada em delta (quando só o custo da solução corrente mudou)."""
+        return Move(self.kind, self.i, self.j, self.l, self.m, self.f + delta, self.d_i, self.d_j, self.len_i, self.len_j, self.movement)
+
+
+class MoveBatch:
+    def __init__(
+        self, kind: str, i: int, j: int, f: np.ndarray, valid: np.ndarray, d_i: np.ndarray, d_j: np.ndarray, len_i: int, len_j: int, rows: np.ndarray, cols: np.ndarray = None
+    ):
+        # todos os movimentos de um par de rotas; o movimento (l, m) está na posição [l, m] dos arrays
+        self.kind: str = kind
+        self.i: int = i
+        self.j: int = j
+        self.f: np.ndarray = f
+        # máscara dos movimentos que respeitam a capacidade (ou todos, se aceita soluções inválidas)
+        self.valid: np.ndarray = valid
+        self.d_i: np.ndarray = d_i
+        self.d_j: np.ndarray = d_j
+        self.len_i: int = len_i
+        self.len_j: int = len_j
+        # clientes da rota i que vão para a rota j (linhas) e da rota j que vão para a rota i (colunas)
+        self.rows: np.ndarray = rows
+        self.cols: np.ndarray = cols
+
+    def offset(self, delta: float) -> "MoveBatch":
+        """Mesmo lote, com a função objetivo deslocada em delta (quando só o custo da solução corrente mudou)."""
+        return MoveBatch(self.kind, self.i, self.j, self.f + delta, self.valid, self.d_i, self.d_j, self.len_i, self.len_j, self.rows, self.cols)
+
+    def move(self, l: int, m: int) -> Move:
+        movement = [(int(self.rows[l]), self.j)]
+        if self.cols is not None:
+            movement.append((int(self.cols[m]), self.i))
+        return Move(self.kind, self.i, self.j, l, m, self.f[l, m].item(), self.d_i[l, m], self.d_j[l, m], self.len_i, self.len_j, movement)
 
 
 class Instance:
     def __init__(self):
         self.name: str
+        # matriz de distâncias, ou EuclideanDistances com a mesma indexação
         self.w: np.ndarray
         self.d: np.ndarray
         self.c: int
@@ -34,6 +292,13 @@ class Instance:
         self.n: int
         self.k: int
         self.solution: dict
+        self.coords: np.ndarray
+        # vizinhos de cada vértice ordenados por distância
+        self.neighbors: np.ndarray
+        # arestas curtas usadas nas vizinhanças granulares (None quando desativadas)
+        self.candidates: list[list[int]] = None
+        # matriz booleana n x n, ou CandidateEdges com a mesma indexação
+        self.candidate_mask: np.ndarray = None
 
 
 class Parameters:
@@ -44,11 +309,157 @@ class Parameters:
         self.i: float = invalid_multiplier
 
 
+class Options:
+    def __init__(
+        self,
+        run_time: int,
+        invalid: bool = False,
+        batch: bool = False,
+        granular_k: int = None,
+        cpu_time: bool = False,
+        save_every: int = 1,
+        save_improvements: bool = False,
+        float_costs: bool = False,
+        cw_top_k: int = None,
+        neighborhood_workers: int = 1,
+        max_iterations: int = None,
+        max_no_improvement: int = None,
+        target_gap: float = None,
+        instrument: bool = False,
+        adaptive_operators: bool = False,
+        move_cache: bool = False,
+        distances: str = "matrix",
+        distance_cache: int = 0,
+    ):
+        # opções de execução comuns a todas as combinações de parâmetros
+        self.run_time: int = run_time
+        self.invalid: bool = invalid
+        self.batch: bool = batch
+        self.granular_k: int = granular_k
+        self.cpu_time: bool = cpu_time
+        # quais iterações são guardadas no .csv da execução
+        self.save_every: int = save_every
+        self.save_improvements: bool = save_improvements
+        # mantém as distâncias reais em vez de arredondá-las para inteiros
+        self.float_costs: bool = float_costs
+        # vizinhos mais próximos de cada cliente cujos pares o Clarke-Wright considera (None para todos os pares)
+        self.cw_top_k: int = cw_top_k
+        # processos que dividem a avaliação de cada vizinhança dentro de uma iteração
+        self.neighborhood_workers: int = neighborhood_workers
+        # critérios de parada além do tempo (None para desativar); o alvo é a melhor solução conhecida com a folga dada
+        self.max_iterations: int = max_iterations
+        self.max_no_improvement: int = max_no_improvement
+        self.target_gap: float = target_gap
+        # mede o tempo de cada fase das iterações e conta os movimentos de cada vizinhança
+        self.instrument: bool = instrument
+        # escolhe as vizinhanças conforme a melhora por segundo de cada uma
+        self.adaptive_operators: bool = adaptive_operators
+        # reaproveita entre iterações os movimentos dos pares de rotas que não mudaram
+        self.move_cache: bool = move_cache
+        # "matrix" guarda a matriz de distâncias; "lazy" calcula as distâncias a partir das coordenadas (EUC_2D), com as
+        # distâncias aos distance_cache vizinhos mais próximos de cada vértice guardadas
+        self.distances: str = distances
+        self.distance_cache: int = distance_cache
+
+
+class StoppingCriteria:
+    def __init__(self, max_iterations: int = None, max_no_improvement: int = None, target: float = None):
+        self.max_iterations: int = max_iterations
+        # iterações sem melhora da melhor solução global
+        self.max_no_improvement: int = max_no_improvement
+        # custo que, se alcançado, encerra a busca
+        self.target: float = target
+
+    def check(self, run: "Run", p: "Instance", time: float) -> str:
+        """Confere os critérios ao fim de uma iteração, registrando na execução quando o alvo é alcançado.
+
+        Returns:
+            str: o critério que encerra a busca, ou None para continuar
+        """
+        if self.target is not None and run.best_solution.f <= self.target and len(run.best_solution) <= p.k and run.best_solution.get_overcapacity(p.c) == 0:
+            run.time_to_target = time
+            run.iteration_to_target = run.iteration
+            return "target"
+        if self.max_iterations is not None and run.iteration >= self.max_iterations:
+            return "max_iterations"
+        if self.max_no_improvement is not None and run.iteration - run.last_improvement >= self.max_no_improvement:
+            return "no_improvement"
+        return None
+
+
+class Trajectory:
+    def __init__(self, save_every: int = 1, save_improvements: bool = False, chunk_size: int = 1000):
+        self.path: str = None
+        self.save_every: int = save_every
+        self.save_improvements: bool = save_improvements
+        self.chunk_size: int = chunk_size
+
+        # linhas ainda não escritas, guardadas por coluna
+        self.index: list[int] = []
+        self.columns: dict[str, list] = {"local": [], "global": [], "time": [], "solution": [], "over_k": [], "over_c": []}
+        self.written: bool = False
+
+        self.iteration: int = 0
+        self.best_f: float = None
+        # última iteração não guardada, escrita ao final para que o arquivo sempre termine na última iteração
+        self.skipped: tuple = None
+
+        # solução corrente de menor custo entre todas as iterações, guardadas ou não
+        self.min_local: float = None
+        self.min_local_iteration: int = None
+        self.min_local_time: float = None
+
+    def append(self, s: Solution, best_f: float, time: float, over_k: bool = None, over_c: bool = None):
+        it = self.iteration
+        self.iteration += 1
+
+        if self.min_local is None or s.f < self.min_local:
+            self.min_local = s.f
+            self.min_local_iteration = it
+            self.min_local_time = time
+
+        improved = self.best_f is None or best_f < self.best_f
+        self.best_f = best_f
+        keep = it == 0 or (improved if self.save_improvements else it % self.save_every == 0)
+
+        if not keep:
+            # a solução corrente é alterada no lugar, mas só é lida no close, quando já está no estado da última iteração
+            self.skipped = (it, s.f, best_f, time, s.s, over_k, over_c)
+            return
+
+        self.skipped = None
+        self.add_row(it, s.f, best_f, time, s.s, over_k, over_c)
+
+    def add_row(self, it: int, local: float, best_f: float, time: float, routes: list[list[int]], over_k: bool, over_c: bool):
+        self.index.append(it)
+        for k, v in zip(self.columns.keys(), [local, best_f, time, str(routes), over_k, over_c]):
+            self.columns[k].append(v)
+
+        if len(self.index) >= self.chunk_size and self.path is not None:
+            self.flush()
+
+    def flush(self):
+        if len(self.index) == 0:
+            return
+
+        pd.DataFrame(self.columns, index=self.index).to_csv(self.path, mode="a" if self.written else "w", header=not self.written)
+        self.written = True
+        self.index = []
+        self.columns = {k: [] for k in self.columns.keys()}
+
+    def close(self):
+        if self.skipped is not None:
+            self.add_row(*self.skipped)
+            self.skipped = None
+        self.flush()
+
+
 class Run:
     def __init__(self, s: Solution, n: int, valid_parameters: Parameters, invalid_parameters: Parameters, seed: int = None):
         self.common_movements: dict[int, int] = {i: 0 for i in range(n)}
-        self.tabu_list = {i: [] for i in range(n)}
-        self.tabu_tenures = {i: [] for i in range(n)}
+        # iteração até a qual mover o cliente (linha) para a rota (coluna) é tabu
+        self.tabu_until: np.ndarray = np.zeros((n, len(s.s)), dtype=np.int64)
+        self.iteration: int = 0
 
         self.params = invalid_parameters
         self.valid_parameters = valid_parameters
@@ -58,23 +469,84 @@ class Run:
         self.a = 1
         self.b = 1
 
-        self.best_solution: Solution = s
+        self.best_solution: Solution = s.copy()
         self.savefile_suffix = (
             f"t_{valid_parameters.tabu_tenure}_f_{valid_parameters.f}_o_{valid_parameters.i}_t_{invalid_parameters.tabu_tenure}_f_{invalid_parameters.f}_o_{invalid_parameters.i}_s_{seed}.csv"
         )
-        self.savefile = pd.DataFrame({"local": [s.f], "global": [s.f], "time": [0.0], "solution": [s.s]})
+        self.initial_solution: Solution = s
+        # sem arquivo até o begin_savefile
+        self.save_path: str = None
+        self.savefile: Trajectory = None
         self.seed: int = seed
 
-    def begin_savefile(self, file_save_path: str, instance_name: str):
+        # resumo da busca, preenchido pelo run_tabu
+        self.last_improvement: int = 0
+        self.elapsed: float = 0.0
+        self.stop_reason: str = None
+        self.time_to_target: float = None
+        self.iteration_to_target: int = None
+        # resumo dos tempos por fase e contadores, quando a execução é instrumentada
+        self.instrumentation: dict = None
+        # estatísticas de cada vizinhança, quando escolhidas de forma adaptativa
+        self.operators: dict = None
+        # acertos e faltas do cache de movimentos, quando usado
+        self.move_cache: dict = None
+
+    def is_tabu(self, v: int, r: int) -> bool:
+        return self.tabu_until[v, r] > self.iteration
+
+    def make_tabu(self, v: int, r: int):
+        # tabu nas próximas t - 1 iterações
+        self.tabu_until[v, r] = max(self.tabu_until[v, r], self.iteration + self.params.t)
+
+    def begin_savefile(self, file_save_path: str, instance_name: str, save_every: int = 1, save_improvements: bool = False):
         self.save_path = f"{file_save_path}/{instance_name}__{self.savefile_suffix}"
+        self.savefile = Trajectory(save_every, save_improvements)
+        self.savefile.path = self.save_path
+        self.savefile.append(self.initial_solution, self.initial_solution.f, 0.0)
 
     def update_savefile(self, s: Solution, time: float, over_k: bool, over_c: bool):
-        self.savefile = pd.concat(
-            [self.savefile, pd.DataFrame({"local": [s.f], "global": [self.best_solution.f], "time": [time], "solution": [s.s], "over_k": [over_k], "over_c": [over_c]})], ignore_index=True
-        )
+        # execuções sem begin_savefile (api.py) não guardam a trajetória
+        if self.savefile is None:
+            return
+        self.savefile.append(s, self.best_solution.f, time, over_k, over_c)
 
     def save(self):
-        self.savefile.to_csv(self.save_path)
+        if self.savefile is None:
+            return
+        self.savefile.close()
+        # o resumo fica ao lado do .csv, com o mesmo nome
+        with open(self.save_path.removesuffix(".csv") + ".json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def summary(self) -> dict:
+        return {
+            "best": self.best_solution.f,
+            "iterations": self.iteration,
+            "time": self.elapsed,
+            "last_improvement": self.last_improvement,
+            "stop_reason": self.stop_reason,
+            "time_to_target": self.time_to_target,
+            "iteration_to_target": self.iteration_to_target,
+            "instrumentation": self.instrumentation,
+            "operators": self.operators,
+            "move_cache": self.move_cache,
+        }
+
+    def snapshot(self) -> "Run":
+        """Cópia apenas com o estado usado na avaliação dos movimentos, para enviar aos processos que avaliam a
+        vizinhança."""
+        run = Run.__new__(Run)
+        run.common_movements = self.common_movements
+        run.tabu_until = self.tabu_until
+        run.iteration = self.iteration
+        run.params = self.params
+        run.a = self.a
+        run.b = self.b
+        # a avaliação só usa o custo da melhor solução, no critério de aspiração
+        run.best_solution = Solution.__new__(Solution)
+        run.best_solution.f = self.best_solution.f
+        return run
 
     def reset_values(self):
         if self.invalid_mode:
@@ -82,18 +554,125 @@ class Run:
             self.invalid_mode = False
 
 
-def get_instance(path: str) -> Instance:
-    instance = vrplib.read_instance(f"{path}.vrp")
+def get_options(d: dict, cpu_time: bool = False) -> Options:
+    """Lê as opções de execução do arquivo de configuração."""
+    # sem nenhum critério de parada a busca não terminaria, em nenhum dos comandos
+    if d["run_time"] is None and all(d.get(k) is None for k in ("max_iterations", "max_no_improvement", "target_gap")):
+        raise ValueError("Configuration file needs a stopping criterion: run_time, max_iterations, max_no_improvement or target_gap")
+
+    return Options(
+        d["run_time"],
+        d["invalid_run"] if "invalid_run" in d else False,
+        d["batch"] if "batch" in d else False,
+        d["granular_k"] if "granular_k" in d else None,
+        cpu_time or (d["cpu_time"] if "cpu_time" in d else False),
+        d["save_every"] if "save_every" in d else 1,
+        d["save_improvements"] if "save_improvements" in d else False,
+        d["float_costs"] if "float_costs" in d else False,
+        d["cw_top_k"] if "cw_top_k" in d else None,
+        d["neighborhood_workers"] if "neighborhood_workers" in d else 1,
+        d["max_iterations"] if "max_iterations" in d else None,
+        d["max_no_improvement"] if "max_no_improvement" in d else None,
+        d["target_gap"] if "target_gap" in d else None,
+        d["instrument"] if "instrument" in d else False,
+        d["adaptive_operators"] if "adaptive_operators" in d else False,
+        d["move_cache"] if "move_cache" in d else False,
+        d["distances"] if "distances" in d else "matrix",
+        d["distance_cache"] if "distance_cache" in d else 0,
+    )
+
+
+def get_instance(path: str, cache: bool = True, float_costs: bool = False, distances: str = "matrix", distance_cache: int = 0) -> Instance:
+    """Carrega a instância. Com distances="lazy", p.w calcula as distâncias a partir das coordenadas em vez de guardar a
+    matriz, e p.neighbors só tem os vizinhos mais próximos de cada vértice (veja distances.py)."""
+    if distances == "lazy":
+        data = parse_lazy_instance(path, float_costs, distance_cache)
+    elif distances == "matrix":
+        data = load_instance_data(path, cache, float_costs)
+    else:
+        raise ValueError(f"Unknown distances backend: {distances}")
 
     p = Instance()
-    p.name = instance["name"]
-    p.w = np.round(instance["edge_weight"])
-    p.d = instance["demand"]
-    p.c = instance["capacity"]
-    p.depot_idx = instance["depot"]
-    p.n = instance["dimension"]
+    p.name = str(data["name"])
+    p.w = data["w"]
+    p.d = data["demand"]
+    p.c = int(data["capacity"])
+    p.depot_idx = data["depot"]
+    p.n = int(data["dimension"])
     p.k = int(p.name.split("k")[-1])
+    p.coords = data["coords"]
+
+    offsets = data["route_offsets"]
+    routes = [data["routes"][a:b].tolist() for a, b in zip(offsets, offsets[1:])]
+    p.solution = {"routes": routes, "cost": data["cost"].item()}
 
-    p.solution = vrplib.read_solution(f"{path}.sol")
+    p.neighbors = data["neighbors"]
 
     return p
+
+
+class CandidateEdges:
+    """Arestas candidatas das vizinhanças granulares. Tem a mesma indexação da matriz booleana n x n (edges[a, b] com
+    inteiros ou arrays, com broadcasting), mas só guarda as arestas candidatas, como chaves a * n + b ordenadas, para
+    que a memória continue O(nk) com as distâncias calculadas sob demanda."""
+
+    def __init__(self, n: int, a: np.ndarray, b: np.ndarray):
+        self.n: int = n
+        # a sentinela n * n no final evita conferir se a busca passou do fim
+        self.keys: np.ndarray = np.append(np.unique(a.astype(np.int64) * n + b), n * n)
+        self.shape: tuple[int, int] = (n, n)
+
+    def __getitem__(self, key):
+        a, b = key
+        keys = np.asarray(a, dtype=np.int64) * self.n + np.asarray(b)
+        return self.keys[np.searchsorted(self.keys, keys)] == keys
+
+    def rows(self) -> list[list[int]]:
+        """Vértices candidatos de cada vértice, em ordem crescente."""
+        a, b = np.divmod(self.keys[:-1], self.n)
+        bounds = np.searchsorted(a, np.arange(self.n + 1)).tolist()
+        b = b.tolist()
+        return [b[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def set_granular(p: Instance, k: int):
+    """Restringe as vizinhanças aos movimentos que criam arestas curtas: arestas entre um vértice e um de seus k vizinhos
+    mais próximos (em qualquer direção), além de todas as arestas do depósito.
+
+    Com a matriz de distâncias, as arestas ficam em uma matriz booleana, que é mais rápida de consultar; com as distâncias
+    calculadas sob demanda, ficam em CandidateEdges, para não voltar a ocupar O(n²) de memória.
+    """
+    if isinstance(p.w, np.ndarray):
+        mask = np.zeros((p.n, p.n), dtype=bool)
+        mask[np.arange(p.n)[:, None], p.neighbors[:, :k]] = True
+        mask |= mask.T
+        mask[p.depot_idx, :] = True
+        mask[:, p.depot_idx] = True
+
+        p.candidate_mask = mask
+        p.candidates = [np.flatnonzero(r).tolist() for r in mask]
+        return
+
+    nearest = p.neighbors[:, :k]
+    a = np.repeat(np.arange(p.n), nearest.shape[1])
+    b = nearest.ravel()
+    depot = np.repeat(np.ravel(p.depot_idx), p.n)
+    vertices = np.tile(np.arange(p.n), len(np.ravel(p.depot_idx)))
+
+    edges = CandidateEdges(p.n, np.concatenate([a, b, depot, vertices]), np.concatenate([b, a, vertices, depot]))
+    p.candidate_mask = edges
+    p.candidates = edges.rows()
+
+
+def get_stopping(options: Options, p: Instance) -> StoppingCriteria:
+    """Critérios de parada da execução; o alvo é relativo à melhor solução conhecida da instância."""
+    target = p.solution["cost"] * (1 + options.target_gap) if options.target_gap is not None else None
+    return StoppingCriteria(options.max_iterations, options.max_no_improvement, target)
+
+
+def load_run_instance(instance_path: str, options: Options) -> Instance:
+    """Carrega a instância conforme as opções da execução."""
+    instance = get_instance(instance_path, float_costs=options.float_costs, distances=options.distances, distance_cache=options.distance_cache)
+    if options.granular_k:
+        set_granular(instance, options.granular_k)
+    return instance
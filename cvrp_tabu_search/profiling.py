@@ -0,0 +1,46 @@
+import os
+import pstats
+import cProfile
+import pandas as pd
+
+# sufixo do perfil de cada execução, salvo ao lado do .csv
+PROFILE_SUFFIX = ".prof"
+
+
+def profile_call(f, *args, **kwargs) -> tuple[object, cProfile.Profile]:
+    """Executa f sob o cProfile e retorna o resultado e o perfil."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(f, *args, **kwargs)
+    return result, profiler
+
+
+def function_label(key: tuple[str, int, str]) -> str:
+    file, line, name = key
+    return f"{os.path.basename(file)}:{line}({name})" if line else name
+
+
+def summarize_profiles(results_folder: str, top: int = 30) -> pd.DataFrame:
+    """Junta os perfis da pasta de resultados: as top funções pelo tempo próprio somado, com o tempo próprio em cada
+    instância (somando as combinações de parâmetros), para comparar o custo das funções entre tamanhos de instância.
+
+    Returns:
+        pd.DataFrame: uma linha por função, ordenada pelo tempo próprio total
+    """
+    files = sorted([i for i in os.listdir(results_folder) if i.endswith(PROFILE_SUFFIX)])
+
+    rows = []
+    for i in files:
+        instance_name = i.split("__")[0]
+        stats = pstats.Stats(os.path.join(results_folder, i)).stats
+        for key, (_, calls, tottime, cumtime, _) in stats.items():
+            rows.append([function_label(key), instance_name, calls, tottime, cumtime])
+
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows, columns=["function", "instance", "calls", "tottime", "cumtime"])
+    totals = df.groupby("function").agg({"calls": "sum", "tottime": "sum", "cumtime": "sum"})
+    per_instance = df.pivot_table(index="function", columns="instance", values="tottime", aggfunc="sum", fill_value=0.0)
+
+    summary = totals.join(per_instance).sort_values("tottime", ascending=False)
+    return summary.head(top)
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from cvrp_tabu_search.problem import Instance, Run
+
+# tabela com o resumo de cada execução, na pasta de resultados
+RESULTS_FILE = "results.sqlite"
+
+# colunas do resumo e os nomes usados nas tabelas de análise
+COLUMNS = {
+    "instance": "Instance",
+    "solution": "Solution",
+    "best": "Best",
+    "time": "Time",
+    "iteration": "Iteration",
+    "tenure": "Tenure",
+    "frequency": "Frequency",
+    "invalid": "Invalid",
+    "invalid_tenure": "Invalid Tenure",
+    "invalid_frequency": "Invalid Frequency",
+    "invalid_invalid": "Invalid Invalid",
+    "gap": "Gap",
+    "seed": "Seed",
+}
+
+# o nome do .csv identifica a execução; as demais colunas só existem para execuções registradas ao terminar
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    output TEXT PRIMARY KEY,
+    instance TEXT,
+    solution REAL,
+    best REAL,
+    time REAL,
+    iteration INTEGER,
+    tenure REAL,
+    frequency REAL,
+    invalid REAL,
+    invalid_tenure REAL,
+    invalid_frequency REAL,
+    invalid_invalid REAL,
+    gap REAL,
+    seed TEXT,
+    iterations INTEGER,
+    elapsed REAL,
+    stop_reason TEXT,
+    time_to_target REAL
+)
+"""
+
+
+def connect(results_folder: str) -> sqlite3.Connection:
+    # vários processos podem registrar execuções ao mesmo tempo; o timeout espera o lock de escrita
+    conn = sqlite3.connect(os.path.join(results_folder, RESULTS_FILE), timeout=60)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def save_records(results_folder: str, records: list[dict]):
+    """Registra os resumos, substituindo os de execuções com o mesmo .csv."""
+    if not records:
+        return
+
+    columns = list(records[0].keys())
+    query = f"INSERT OR REPLACE INTO runs ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    conn = connect(results_folder)
+    with conn:
+        conn.executemany(query, [[r[k] for k in columns] for r in records])
+    conn.close()
+
+
+def run_record(p: Instance, run: Run) -> dict:
+    """Resumo de uma execução terminada."""
+    bks = p.solution["cost"]
+    trajectory = run.savefile
+    return {
+        "output": os.path.basename(run.save_path),
+        "instance": p.name,
+        "solution": bks,
+        "best": run.best_solution.f,
+        # iteração (1 para a solução inicial) e tempo da solução corrente de menor custo
+        "time": trajectory.min_local_time,
+        "iteration": trajectory.min_local_iteration + 1,
+        "tenure": run.valid_parameters.tabu_tenure,
+        "frequency": run.valid_parameters.f,
+        "invalid": run.valid_parameters.i,
+        "invalid_tenure": run.invalid_parameters.tabu_tenure,
+        "invalid_frequency": run.invalid_parameters.f,
+        "invalid_invalid": run.invalid_parameters.i,
+        "gap": (run.best_solution.f - bks) / bks,
+        "seed": str(run.seed),
+        "iterations": run.iteration,
+        "elapsed": run.elapsed,
+        "stop_reason": run.stop_reason,
+        "time_to_target": run.time_to_target,
+    }
+
+
+def csv_record(folder_path: str, file_name: str, bks: float) -> dict:
+    """Resumo de uma execução a partir do seu .csv, para pastas de resultados anteriores à tabela."""
+    instance_name, info = file_name.split("__")
+    _, tenure, _, frequency, _, invalid, _, i_tenure, _, i_frequency, _, i_invalid, _, seed = info.removesuffix(".csv").split("_")
+
+    df = pd.read_csv(os.path.join(folder_path, file_name), index_col=0, usecols=[0, 1, 2, 3])
+    best = df["global"].iloc[-1].item()
+    min_iteration = df["local"].idxmin()
+
+    return {
+        "output": file_name,
+        "instance": instance_name,
+        "solution": bks,
+        "best": best,
+        "time": df.loc[min_iteration]["time"].item(),
+        "iteration": int(min_iteration) + 1,
+        "tenure": float(tenure),
+        "frequency": float(frequency),
+        "invalid": float(invalid),
+        "invalid_tenure": float(i_tenure),
+        "invalid_frequency": float(i_frequency),
+        "invalid_invalid": float(i_invalid),
+        "gap": (best - bks) / bks,
+        "seed": seed,
+    }
+
+
+def read_results(results_folder: str) -> pd.DataFrame:
+    """Lê os resumos, na ordem dos nomes dos .csv, com os nomes de coluna das tabelas de análise."""
+    conn = connect(results_folder)
+    df = pd.read_sql("SELECT * FROM runs ORDER BY output", conn)
+    conn.close()
+    # os custos são guardados como REAL; voltam a ser inteiros quando as distâncias são arredondadas, como nos .csv
+    for c in ["solution", "best"]:
+        if len(df) > 0 and (df[c] == df[c].round()).all():
+            df[c] = df[c].astype(np.int64)
+    return df.rename(columns=COLUMNS)
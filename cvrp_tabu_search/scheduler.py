@@ -0,0 +1,44 @@
+import random
+
+
+class OperatorScheduler:
+    """Escolhe a vizinhança de cada iteração por roleta, com peso proporcional à melhora por segundo de avaliação que
+    cada vizinhança trouxe até agora (média exponencial). Uma parcela exploration da probabilidade é dividida igualmente,
+    para que nenhuma vizinhança deixe de ser testada."""
+
+    def __init__(self, structures: list, reaction: float = 0.1, exploration: float = 0.1):
+        # peso das novas observações na média
+        self.reaction: float = reaction
+        self.exploration: float = exploration
+
+        # melhora por segundo estimada de cada vizinhança; começa igual para todas
+        self.rate: dict = {f: 1.0 for f in structures}
+        self.calls: dict = {f: 0 for f in structures}
+        self.time: dict = {f: 0.0 for f in structures}
+        self.reward: dict = {f: 0.0 for f in structures}
+
+    def probabilities(self, structures: list) -> list[float]:
+        total = sum([self.rate[f] for f in structures])
+        uniform = 1 / len(structures)
+        if total <= 0:
+            return [uniform] * len(structures)
+        return [(1 - self.exploration) * self.rate[f] / total + self.exploration * uniform for f in structures]
+
+    def choose(self, structures: list):
+        """Sorteia uma das vizinhanças disponíveis."""
+        return random.choices(structures, weights=self.probabilities(structures))[0]
+
+    def update(self, f, elapsed: float, reward: float):
+        """Registra uma avaliação da vizinhança f que levou elapsed segundos e melhorou a solução em reward."""
+        self.calls[f] += 1
+        self.time[f] += elapsed
+        self.reward[f] += reward
+        if elapsed > 0:
+            self.rate[f] = (1 - self.reaction) * self.rate[f] + self.reaction * reward / elapsed
+
+    def summary(self) -> dict:
+        structures = list(self.rate.keys())
+        return {
+            f.__name__: {"calls": self.calls[f], "time": self.time[f], "reward": self.reward[f], "rate": self.rate[f], "probability": prob}
+            for f, prob in zip(structures, self.probabilities(structures))
+        }
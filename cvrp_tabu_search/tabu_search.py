@@ -1,69 +1,235 @@
 import time
 import random
 import math
+from typing import Callable
+import numpy as np
 from tqdm import tqdm
-from cvrp_tabu_search.problem import Instance, Solution, Run
-from cvrp_tabu_search.neighborhoods import shift_neighborhood, intraswap_neighborhood, swap_neighborhood, crossover_neighborhood
+from cvrp_tabu_search.problem import Instance, Solution, Run, Move, MoveBatch, StoppingCriteria
+from cvrp_tabu_search.parallel import NeighborhoodPool
+from cvrp_tabu_search.instrumentation import Instrumentation, PHASES_SUFFIX
+from cvrp_tabu_search.scheduler import OperatorScheduler
+from cvrp_tabu_search.move_cache import MoveCache
+from cvrp_tabu_search.neighborhoods import (
+    shift_neighborhood,
+    intraswap_neighborhood,
+    swap_neighborhood,
+    crossover_neighborhood,
+    shift_neighborhood_batch,
+    swap_neighborhood_batch,
+    shift_neighborhood_granular,
+    swap_neighborhood_granular,
+    crossover_neighborhood_granular,
+    apply_move,
+)
 
+# estruturas de vizinhança da busca
+STRUCTURES = [shift_neighborhood, intraswap_neighborhood, swap_neighborhood, crossover_neighborhood]
+# vizinhanças que possuem versão avaliada em lote
+BATCHED = {shift_neighborhood: shift_neighborhood_batch, swap_neighborhood: swap_neighborhood_batch}
+# vizinhanças que possuem versão granular (usadas quando a instância tem lista de candidatos)
+GRANULAR = {shift_neighborhood: shift_neighborhood_granular, swap_neighborhood: swap_neighborhood_granular, crossover_neighborhood: crossover_neighborhood_granular}
 
-def get_best_neighbor(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool = False):
-    # guarda o melhor das vizinhanças
-    best_solution: Solution = None
-    best_solution_movement = None
+
+def get_best_neighbor(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool = False) -> Move:
+    return find_best_neighbor(structure_list, s, p, run, accept_all)[0]
+
+
+def get_best_neighbor_batch(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool = False) -> Move:
+    return find_best_neighbor_batch(structure_list, s, p, run, accept_all)[0]
+
+
+def find_best_neighbor(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool = False, routes: range = None) -> tuple[Move, float]:
+    """Retorna o melhor movimento das vizinhanças e o seu valor penalizado. Com routes, só percorre os movimentos cujas
+    rotas pivô estão no bloco dado."""
+    # guarda o melhor movimento das vizinhanças
+    best_move: Move = None
     best_f: float = math.inf
 
     # roda todas as estruturas de vizinhança
     for f in structure_list:
-        for s_, movement in f(s, p, accept_all):
-            s_: Solution = s_
+        mv, score = best_of_moves(f(s, p, accept_all, routes), s, p, run)
+        if best_f > score:
+            best_move = mv
+            best_f = score
+
+    return best_move, best_f
 
-            # calcula o bias para soluções com k maior que o permitido
-            invalid_k_bias = run.b * s_.min() if len(s_) > p.k else 0
 
-            # calcula o bias para soluções com capacidade maior que a permitida
-            invalid_capacity_bias = s_.get_overcapacity(p.c) * run.a
+def best_of_moves(moves, s: Solution, p: Instance, run: Run) -> tuple[Move, float]:
+    """Primeiro dos movimentos com o menor valor penalizado, e o valor."""
+    best_move: Move = None
+    best_f: float = math.inf
 
-            # confere se é tabu
-            if any([i[1] in run.tabu_list[i[0]] for i in movement]):
-                # confere se bate o critério de aspiração
-                if s_.f < run.best_solution.f and (best_f > s_.f + invalid_k_bias + invalid_capacity_bias):
-                    best_solution = s_
-                    best_solution_movement = movement
-                    best_f = s_.f + invalid_k_bias + invalid_capacity_bias
+    for mv in moves:
+        mv: Move = mv
+        k, min_len, overcapacity = s.evaluate(mv, p.c)
 
-            else:
-                # adiciona bias de frequência
-                common_bias = sum([run.common_movements[i] for i, _ in movement]) * run.params.f
+        # calcula o bias para soluções com k maior que o permitido
+        invalid_k_bias = run.b * min_len if k > p.k else 0
+
+        # calcula o bias para soluções com capacidade maior que a permitida
+        invalid_capacity_bias = overcapacity * run.a
+
+        # confere se é tabu
+        if any([run.is_tabu(v, r) for v, r in mv.movement]):
+            # confere se bate o critério de aspiração
+            if mv.f < run.best_solution.f and (best_f > mv.f + invalid_k_bias + invalid_capacity_bias):
+                best_move = mv
+                best_f = mv.f + invalid_k_bias + invalid_capacity_bias
+
+        else:
+            # adiciona bias de frequência
+            common_bias = sum([run.common_movements[i] for i, _ in mv.movement]) * run.params.f
+
+            # confere se é o melhor movimento da vizinhança até agora
+            if best_f > mv.f + invalid_k_bias + common_bias + invalid_capacity_bias:
+                best_move = mv
+                best_f = mv.f + invalid_k_bias + common_bias + invalid_capacity_bias
+
+    return best_move, best_f
+
+
+def find_best_neighbor_batch(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool = False, routes: range = None) -> tuple[Move, float]:
+    """Mesmo que find_best_neighbor, para as vizinhanças avaliadas em lote."""
+    # guarda o melhor movimento das vizinhanças
+    best_move: Move = None
+    best_f: float = math.inf
+
+    # roda todas as estruturas de vizinhança
+    for f in structure_list:
+        mv, score = best_of_batches(f(s, p, accept_all, routes), s, p, run)
+        if best_f > score:
+            best_move = mv
+            best_f = score
+
+    return best_move, best_f
+
+
+def best_of_batches(batches, s: Solution, p: Instance, run: Run) -> tuple[Move, float]:
+    """Mesmo que best_of_moves, para lotes de movimentos."""
+    best_move: Move = None
+    best_f: float = math.inf
+
+    total_overcapacity = s.get_overcapacity(p.c)
+
+    for batch in batches:
+        batch: MoveBatch = batch
+        k, min_len = s.route_stats(batch.i, batch.len_i, batch.j, batch.len_j)
+
+        # calcula o bias para soluções com k maior que o permitido
+        invalid_k_bias = run.b * min_len if k > p.k else 0
+
+        # calcula o bias para soluções com capacidade maior que a permitida
+        overcapacity = total_overcapacity - max(0, s.d[batch.i] - p.c) - max(0, s.d[batch.j] - p.c)
+        overcapacity = overcapacity + np.maximum(0, batch.d_i - p.c) + np.maximum(0, batch.d_j - p.c)
+        invalid_capacity_bias = overcapacity * run.a
+
+        # confere quais movimentos são tabu e calcula o bias de frequência
+        tabu = (run.tabu_until[batch.rows, batch.j] > run.iteration)[:, None]
+        common = np.array([run.common_movements[v] for v in batch.rows])[:, None]
+        if batch.cols is not None:
+            tabu = tabu | (run.tabu_until[batch.cols, batch.i] > run.iteration)[None, :]
+            common = common + np.array([run.common_movements[u] for u in batch.cols])[None, :]
+        common_bias = common * run.params.f
+
+        # movimentos tabu só são aceitos pelo critério de aspiração e não recebem o bias de frequência
+        score = np.where(tabu, batch.f + invalid_k_bias + invalid_capacity_bias, batch.f + invalid_k_bias + common_bias + invalid_capacity_bias)
+        score[~(batch.valid & (~tabu | (batch.f < run.best_solution.f)))] = math.inf
 
-                # confere se é a melhor solução da vizinhança até agora
-                if best_f > s_.f + invalid_k_bias + common_bias + invalid_capacity_bias:
-                    best_solution = s_
-                    best_solution_movement = movement
-                    best_f = s_.f + invalid_k_bias + common_bias + invalid_capacity_bias
+        l, m = np.unravel_index(np.argmin(score), score.shape)
+        if best_f > score[l, m]:
+            best_move = batch.move(l, m)
+            best_f = score[l, m]
 
-    return best_solution, best_solution_movement
+    return best_move, best_f
 
 
-def run_tabu(p: Instance, max_time: int, run: Run, s: Solution, invalid: bool = False) -> Run:
+def find_best_neighbor_cached(structure_list: list, s: Solution, p: Instance, run: Run, accept_all: bool, cache: MoveCache) -> tuple[Move, float]:
+    """Mesmo que find_best_neighbor (ou find_best_neighbor_batch), com os movimentos de cada par de rotas guardados no
+    cache. As penalidades nunca são negativas, então o menor custo dos movimentos de um par limita o valor penalizado
+    deles: os pares são avaliados do menor custo para o maior, até que nenhum dos restantes possa superar o melhor
+    movimento encontrado. Nos empates fica o par percorrido primeiro, então o movimento é o mesmo da busca completa."""
+    groups = [(f, entry) for f in structure_list for entry in cache.groups(f, s, p, accept_all)]
+    bounds = [cache.lower_bound(entry, s) for _, entry in groups]
+
+    best_move: Move = None
+    best_f: float = math.inf
+    best_g: int = len(groups)
+
+    for g in sorted(range(len(groups)), key=bounds.__getitem__):
+        if bounds[g] > best_f or (bounds[g] == best_f and g > best_g):
+            break
+
+        f, entry = groups[g]
+        best_of = best_of_batches if f in BATCHED.values() else best_of_moves
+        mv, score = best_of(cache.moves(entry, s), s, p, run)
+        if mv is not None and (best_f > score or (best_f == score and g < best_g)):
+            best_move = mv
+            best_f = score
+            best_g = g
+
+    return best_move, best_f
+
+
+def run_tabu(
+    p: Instance,
+    max_time: int,
+    run: Run,
+    s: Solution,
+    invalid: bool = False,
+    batch: bool = False,
+    cpu_time: bool = False,
+    progress: bool = True,
+    callback: Callable[[Run, Solution], bool] = None,
+    pool: NeighborhoodPool = None,
+    stopping: StoppingCriteria = None,
+    instrument: Instrumentation = None,
+    scheduler: OperatorScheduler = None,
+    cache: MoveCache = None,
+) -> Run:
+    """Executa a busca tabu a partir de s por max_time segundos (None para não limitar o tempo), ou até algum dos
+    critérios de stopping ser atingido. O motivo da parada fica em run.stop_reason.
+
+    callback, se dado, é chamado ao fim de cada iteração com a execução e a solução corrente, que ele pode alterar (por
+    exemplo, para reiniciar a busca); se retornar verdadeiro, a busca é interrompida.
+
+    pool, se dado, divide a avaliação de cada vizinhança entre os seus processos; o movimento escolhido é o mesmo da
+    avaliação serial.
+
+    instrument, se dado, mede o tempo de cada fase das iterações e conta os movimentos de cada vizinhança (os contadores
+    não são coletados quando a avaliação é dividida pelo pool).
+
+    scheduler, se dado, escolhe as vizinhanças conforme a melhora por segundo de cada uma, em vez de uniformemente.
+
+    cache, se dado, guarda os movimentos de cada par de rotas entre iterações, e só gera de novo os dos pares cujas rotas
+    mudaram (exceto nas vizinhanças granulares escalares, que não são percorridas por pares, e com o pool; as versões em
+    lote aplicam a máscara de candidatos, que não muda, dentro de cada par e usam o cache). O movimento escolhido é o
+    mesmo; os contadores da instrumentação não são coletados para as vizinhanças que usam o cache.
+    """
+    # mede o orçamento em tempo de CPU quando várias execuções dividem a máquina
+    clock = time.process_time if cpu_time else time.time
+
+    if max_time is None:
+        max_time = math.inf
+
     t = 0
     it = 1
-    pbar = tqdm(total=max_time)
+    # sem a barra quando desativada, para não pagar pelas suas chamadas a cada iteração
+    pbar = tqdm(total=max_time if max_time < math.inf else None) if progress else None
+
+    # os movimentos são aplicados diretamente na solução corrente
+    s = s.copy()
 
     over_k = len(s) > p.k
     over_c = s.get_overcapacity(p.c) > 0
 
     while t < max_time:
-        t_s = time.time()
-
-        # atualiza tabu tenure
-        for k in run.tabu_list.keys():
-            i = len(run.tabu_list[k]) - 1
-            while i >= 0:
-                run.tabu_tenures[k][i] -= 1
-                if run.tabu_tenures[k][i] == 0:
-                    run.tabu_list[k].pop(i)
-                    run.tabu_tenures[k].pop(i)
-                i -= 1
+        t_s = clock()
+        if instrument is not None:
+            instrument.begin()
+
+        # os movimentos tabu expiram sozinhos ao comparar com a iteração atual
+        run.iteration = it
 
         # reune os tipos de estruturas de vizinhança
         if over_k:
@@ -74,21 +240,50 @@ def run_tabu(p: Instance, max_time: int, run: Run, s: Solution, invalid: bool =
             # troca para usar os parâmetros de quando a solução é válida
             run.reset_values()
 
-        s_ = None
-        while s_ is None:
+        mv = None
+        while mv is None:
             # escolhe uma estrutura de vizinhança aleatoriamente
-            neighbor_method = random.choice(structures)
+            if scheduler is None:
+                neighbor_method = random.choice(structures)
+            else:
+                neighbor_method = scheduler.choose(structures)
+                t_n = time.perf_counter()
             # remove a estrutura para evitar de procurar nela novamente
             structures.remove(neighbor_method)
-            # encontra nova solução que respeita o tabu ou o critério de aspiração
-            s_, movement = get_best_neighbor([neighbor_method], s, p, run, over_c or over_k)
-        s = s_
+            # encontra movimento que respeita o tabu ou o critério de aspiração
+            if batch and neighbor_method in BATCHED:
+                search, structure = find_best_neighbor_batch, BATCHED[neighbor_method]
+            elif p.candidates is not None and neighbor_method in GRANULAR:
+                search, structure = find_best_neighbor, GRANULAR[neighbor_method]
+            else:
+                search, structure = find_best_neighbor, neighbor_method
+            if pool is not None:
+                mv = pool.search(search, [structure], s, run, over_c or over_k)
+            elif cache is not None and MoveCache.supports(structure):
+                mv, _ = find_best_neighbor_cached([structure], s, p, run, over_c or over_k, cache)
+            else:
+                if instrument is not None:
+                    structure = instrument.wrap(structure, run)
+                mv, _ = search([structure], s, p, run, over_c or over_k)
+
+            if scheduler is not None:
+                elapsed = time.perf_counter() - t_n
+                # a vizinhança sem movimento possível gastou tempo sem melhorar nada
+                if mv is None:
+                    scheduler.update(neighbor_method, elapsed, 0.0)
+        if instrument is not None:
+            instrument.lap("scoring")
+
+        f_before = s.f
+        best_before = run.best_solution.f
+        apply_move(s, mv, p)
+        if instrument is not None:
+            instrument.lap("apply")
 
         # atualiza as frequências dos movimentos e a lista tabu
-        for i in movement:
+        for i in mv.movement:
             run.common_movements[i[0]] += 1
-            run.tabu_list[i[0]].append(i[1])
-            run.tabu_tenures[i[0]].append(run.params.t)
+            run.make_tabu(i[0], i[1])
 
         over_k = len(s) > p.k
         run.b = max(100, run.b * (1 + run.params.i)) if over_k else min(0.0001, run.b / (1 + run.params.i))
@@ -98,21 +293,61 @@ def run_tabu(p: Instance, max_time: int, run: Run, s: Solution, invalid: bool =
 
         # atualiza melhor global
         if not over_k and not over_c and run.best_solution.f > s.f:
-            run.best_solution = s
+            run.best_solution = s.copy()
+            run.last_improvement = it
 
-        diff = time.time() - t_s
+        if scheduler is not None:
+            # melhora da solução corrente, mais a da melhor global quando ela muda
+            scheduler.update(neighbor_method, elapsed, max(0, f_before - s.f) + (best_before - run.best_solution.f))
+        if instrument is not None:
+            instrument.lap("memory")
+
+        diff = clock() - t_s
         t += diff
 
-        pbar.set_description("Iteration %d" % it)
-        pbar.update(diff if diff + pbar.n < max_time else max_time - pbar.n)
+        if pbar is not None:
+            pbar.set_description("Iteration %d" % it)
+            pbar.update(diff if diff + pbar.n < max_time else max_time - pbar.n)
 
-        run.update_savefile(s_, t, over_k, over_c)
+        run.update_savefile(s, t, over_k, over_c)
+        if instrument is not None:
+            instrument.lap("savefile")
 
         if invalid and not over_k:
+            run.stop_reason = "valid"
+        elif stopping is not None:
+            run.stop_reason = stopping.check(run, p, t)
+
+        if run.stop_reason is None and callback is not None:
+            if callback(run, s):
+                run.stop_reason = "callback"
+            else:
+                # o callback pode ter substituído a solução corrente
+                over_k = len(s) > p.k
+                over_c = s.get_overcapacity(p.c) > 0
+
+        if instrument is not None:
+            instrument.lap("control")
+            instrument.end(it, structure.__name__)
+
+        if run.stop_reason is not None:
             break
 
         it += 1
 
+    if run.stop_reason is None:
+        run.stop_reason = "time"
+    run.elapsed = t
+
+    if instrument is not None:
+        if run.save_path is not None:
+            instrument.save(run.save_path.removesuffix(".csv") + PHASES_SUFFIX)
+        run.instrumentation = instrument.summary()
+    if scheduler is not None:
+        run.operators = scheduler.summary()
+    if cache is not None:
+        run.move_cache = cache.summary()
+
     run.save()
 
     return run
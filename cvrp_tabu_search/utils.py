@@ -4,10 +4,10 @@ import numpy as np
 def objective_function(s: list[list[int]], w: np.ndarray) -> int:
     f = 0
     for r in s:
-        f += w[0, r[0]] + w[0, r[-1]]
+        f += w.item(0, r[0]) + w.item(0, r[-1])
         if len(r) > 1:
             for v, u in zip(r, r[1:]):
-                f += w[v, u]
+                f += w.item(v, u)
     return f
 
 